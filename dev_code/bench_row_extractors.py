@@ -0,0 +1,89 @@
+"""Microbenchmark: rows/sec turning GoogleAdsRow dicts into rows of bind values.
+Compares the per-field get_field() treewalk (what get_reports.py used to do for every row and
+every column) against an extractor compiled once per dbschema by row_extractors.compile_extractor().
+Rows are synthetic, shaped like json_format.MessageToDict() output for the keyword_view query.
+Usage: python dev_code/bench_row_extractors.py [N_ROWS]
+"""
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from row_extractors import compile_extractor, get_field, stringify
+
+# Same as keywords_performance_dbschema in get_reports.py
+dbschema = (
+    ("customer.id"                                      , "CUSTOMER_ID"), 
+    ("customer.descriptive_name"                        , "CUENTA"), 
+    ("segments.date"                                    , "DIA"), 
+    ("segments.device"                                  , "DEVICE"), 
+    ("campaign.name"                                    , "CAMPAIGN"), 
+    ("ad_group_criterion.keyword.text"                  , "KEYWORD"), 
+    ("ad_group.name"                                    , "AD_GROUP"), 
+    ("ad_group_criterion.status"                        , "KEYWORD_STATE"), 
+    ("ad_group_criterion.keyword.match_type"            , "MATCH_TYPE"), 
+    ("ad_group_criterion.effective_cpc_bid_micros"      , "MAX_CPC"), 
+    ("metrics.clicks"                                   , "CLICKS"), 
+    ("metrics.impressions"                              , "IMPRESSIONS"), 
+    ("metrics.average_cpc"                              , "AVG_CPC"), 
+    ("metrics.ctr"                                      , "CTR"), 
+    ("metrics.cost_micros"                              , "COST"), 
+    (None                                               , "AVG_POSITION"),
+    ("ad_group_criterion.quality_info.quality_score"    , "QUALITY_SCORE"), 
+    (None                                               , "LABELS"),
+    ("metrics.search_impression_share"                  , "SEARCH_IMPR_SHARE"),
+    ("metrics.search_rank_lost_impression_share"        , "SEARCH_LOST_IS_RANK"), 
+    ("metrics.search_exact_match_impression_share"      , "SEARCH_EXACT_MATCH_IS"), 
+    ("metrics.conversions"                              , "CONVERSIONS"), 
+    ("metrics.all_conversions"                          , "ALL_CONV"), 
+    ("metrics.cross_device_conversions"                 , "CROSS_DEVICE_CONV"), 
+    ("metrics.conversions_value"                        , "TOTAL_CONV_VALUE"), 
+    ("metrics.all_conversions_value"                    , "ALL_CONV_VALUE"), 
+    ("metrics.video_quartile_p100_rate"                 , "VIDEO_PLAYED_TO_100"), 
+    ("metrics.video_quartile_p75_rate"                  , "VIDEO_PLAYED_TO_75"), 
+    ("metrics.video_quartile_p50_rate"                  , "VIDEO_PLAYED_TO_50"),
+    (None                                               , "VIDEO_VIEWS")
+)
+
+def make_row(i):
+    """A GoogleAdsRow dict. Like MessageToDict() does, some metrics are left out (i.e.: unset)"""
+    metrics = {"clicks": str(i % 50), "impressions": str(i % 900), "costMicros": str(i * 1000), 
+               "averageCpc": 1234.5, "ctr": 0.05, "searchImpressionShare": 0.1, "conversions": 1.0,
+               "allConversions": 2.0, "conversionsValue": 3.0, "allConversionsValue": 4.0}
+    if i % 3:
+        metrics.pop("conversions")
+    return {"customer": {"id": "4389555570", "descriptiveName": "Fravega"},
+            "segments": {"date": "2022-09-01", "device": "MOBILE"},
+            "campaign": {"name": f"campaign {i % 20}"},
+            "adGroup": {"name": f"ad group {i % 200}"},
+            "adGroupCriterion": {"keyword": {"text": f"keyword {i}", "matchType": "EXACT"},
+                                 "status": "ENABLED", "effectiveCpcBidMicros": "10000",
+                                 "qualityInfo": {"qualityScore": 7}},
+            "metrics": metrics,}
+
+def treewalk(results):
+    """The old way: get_field() on every field of every row"""
+    gaql_cols_names = [col[0] for col in dbschema]
+    return [[stringify(get_field(result, field)) for field in gaql_cols_names] for result in results]
+
+def compiled(results):
+    """The new way: an extractor compiled once per dbschema"""
+    extract = compile_extractor(dbschema)
+    return [extract(result) for result in results]
+
+def bench(func, results, repeat = 3):
+    best = min(_timed(func, results) for _ in range(repeat))
+    print(f"{func.__name__:>10}: {len(results) / best:>12,.0f} rows/sec ({best:.3f} secs for {len(results)} rows)")
+    return best
+
+def _timed(func, results):
+    start = time.perf_counter()
+    func(results)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if sys.argv[1:] else 100_000
+    results = [make_row(i) for i in range(n_rows)]
+
+    assert [tuple(row) for row in treewalk(results[:1000])] == compiled(results[:1000]), "Extractors disagree!!!"
+    before = bench(treewalk, results)
+    after = bench(compiled, results)
+    print(f"speedup: {before / after:.1f}x")
@@ -4,17 +4,23 @@ If you need to obtain a list of accounts, please see the
 account_management/get_account_hierarchy.py or
 account_management/list_accessible_customers.py examples.
 """
-import argparse, sys, multiprocessing, time, json
+import argparse, os, sys, multiprocessing, threading, asyncio, queue, heapq, statistics, math, time, json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, ExitStack
+from importlib import import_module
 from collections import namedtuple
-from datetime import date
-from itertools import product
+from datetime import date, timedelta
+from itertools import product, count
 
 # Uncomment following line for Oracle Low Level debugging to stderr
 # os.environ['DPI_DEBUG_LEVEL'] = '16'
 DB_CONFIG_FILE = 'databases.json'
 DB_DEFAULT = "DESA STG"
 
-ORACLE_BATCH_SIZE = 1024        # Nice 2-round number. TODO: .executemany() in batches of size
+ORACLE_BATCH_SIZE = 1024        # Nice 2-round number. Default size of the .executemany() batches (see load_rows())
+ORACLE_MAX_IN_LIST = 1000       # Max n of values of an IN (...) list, as far as Oracle's concerned (ORA-01795)
+LOADERS = 4                     # Default n of threads loading results into the database, concurrently (see run_loader())
+STAGING_SUFFIX = '_STG'         # Staging table of every dbtable, for merged loads: <dbtable>_STG (see create_staging_tables())
 # Valid fields for campaign.status field -- From Google Ads documentation
 # https://developers.google.com/google-ads/api/fields/v11/campaign#campaign.status
 CAMPAIGN_VALID_STATUSES = ('ENABLED', 'PAUSED', 'REMOVED', 'UNKNOWN', 'UNSPECIFIED')                                                                                            
@@ -23,18 +29,131 @@ import cx_Oracle
 # NOTE: KEEP IN MIND THAT THIS IS Conditional on which underlying platform this is running? Windows 10 until now...
 cx_Oracle.init_oracle_client(lib_dir = r'C:\code\fravega\Fravega_api_request_test\instantclient_21_6')
 
+import grpc
+from google.api_core import grpc_helpers_async
 from google.ads.googleads.client import GoogleAdsClient
 from google.ads.googleads.errors import GoogleAdsException
 from google.protobuf import json_format
 
-# Max n of procs to spawn / Timeout between retries in secs / Max n of retries for errors
+from row_extractors import compile_extractor, compile_proto_extractor
+from throttling import AdaptiveConcurrency, RateLimiter, is_throttled
+from retry_policy import RetryPolicy, MAX_RETRIES, BACKOFF_BASE, BACKOFF_CAP, RETRY_BUDGET_RATIO
+from state_store import StateStore, STATE_DB_FILE
+from response_cache import ResponseCache, CACHE_DIR, CACHE_MAX_BYTES, CACHE_FINAL_DAYS
+from spool import SpoolWriter, spool_file, read_batch, replay
+from run_manifest import RunManifest, read_failures, prune_runs, RUNS_DIR, RUNS_KEEP_DAYS, MANIFEST_FILE, FAILURES_FILE
+from run_manifest import PLANNED, LOADED, COMMITTED, FAILED
+
+# Max n of procs to spawn. NOTE: how failed requests get retried is up to retry_policy.py
 PROCS_PER_CPU = 1 # Given that most of the time processes are blocking, multiple workers could be assigned per-CPU
-MAX_PROCESSES, BACKOFF_FACTOR, MAX_RETRIES = multiprocessing.cpu_count() * PROCS_PER_CPU, 5, 0
+MAX_PROCESSES = multiprocessing.cpu_count() * PROCS_PER_CPU
+# Max n of threads for the 'thread' executor. Threads are cheap, and fetching is I/O bound
+MAX_THREADS = 4 * MAX_PROCESSES
+# Max n of jobs in flight (running, queued, or finished but not yet loaded). Bounds parent memory regardless of
+# how many customer_ids are requested, while keeping every worker busy as the loader catches up
+MAX_PENDING = 2 * MAX_PROCESSES
+
+# How workers extract rows out of GoogleAdsRows. See iter_search_batches()
+EXTRACTION_MODES, EXTRACTION_DEFAULT = ('dict', 'proto'), 'dict'
+
+# Fetch engines: 'pool' runs each job on a multiprocessing.Pool process, while 'asyncio' runs them all as
+# coroutines over a single gRPC channel, up to ASYNC_CONCURRENCY at a time. See stream_events_async()
+ENGINES, ENGINE_DEFAULT, ASYNC_CONCURRENCY = ('pool', 'asyncio'), 'pool', 32
+# Options of the 'asyncio' engine's gRPC channel: the very same GoogleAdsClient gives its own channels, or big
+# GoogleAdsFailure trailers and batches would fail on one engine but not on the other
+GRPC_CHANNEL_OPTIONS = [("grpc.max_metadata_size", 16 * 1024 * 1024),
+                        ("grpc.max_receive_message_length", 64 * 1024 * 1024)]
+# Executors for the 'pool' engine: 'process' runs jobs on a pool of MAX_PROCESSES processes, each one with
+# its own GoogleAdsService, while 'thread' runs them on a pool of MAX_THREADS threads sharing a single one
+EXECUTORS, EXECUTOR_DEFAULT = ('process', 'thread'), 'process'
+GOOGLE_ADS_API_VERSION = "v11"
+# Deadline of every search_stream() call, in secs (None for the client library's default) / Secs without a
+# batch after which a job in flight gets flagged as stalled / Once every input has been submitted, jobs still
+# waiting for their first batch after HEDGE_AFTER_FACTOR times the median job duration get hedged. See stream_events()
+SEARCH_TIMEOUT, STALL_TIMEOUT, HEDGE_AFTER_FACTOR = None, 300, 2
+# Trailing days --incremental runs fetch again, already loaded or not: conversions keep getting restated for a while
+RESTATEMENT_DAYS = 3
+# How workers get set up, every worker alike, but for their events queue. See init_worker()
+WorkerSettings = namedtuple('WorkerSettings', ['extraction', 'client', 'limiter', 'retry_policy', 'timeout', 'claims',
+                                               'cache', 'spool_dir', 'loads_into', 'batch_size', 'replace', 'merge',
+                                               'direct'],
+                            defaults = (EXTRACTION_DEFAULT, None, None, None, SEARCH_TIMEOUT, None, None, None, None,
+                                        ORACLE_BATCH_SIZE, None, False, False))
 
-def main(client, customer_ids, date_range, campaign_status, database):
+_events = None      # Per-worker queue where jobs push their results downstream. See init_worker()
+_extraction = None  # Per-worker extraction mode. See init_worker()
+_ga_service = None  # Per-worker GoogleAdsService. See init_worker()
+_limiter = None     # RateLimiter shared by every worker, if any. See init_worker()
+_retry_policy = None    # RetryPolicy shared by every worker. See init_worker()
+_timeout = None     # Per-worker deadline of search_stream() calls. See init_worker()
+_claims = None      # Which copy of each hedged job gets to push its results, shared by every worker. See init_worker()
+_cache = None       # ResponseCache shared by every worker, if any. See init_worker()
+_spool_dir = None   # Where workers spool their results to, if they do. See init_worker()
+_session_pool = None    # Per-worker sessions where jobs load their own results, if they do. See init_worker()
+_batch_size = None  # Per-worker size of the .executemany() batches, if jobs load their own results. See init_worker()
+_replace = None     # Campaigns whose rows jobs loading their own results replace, by customer_id. See init_worker()
+_merge = False      # Whether jobs loading their own results merge them, through a staging table. See init_worker()
+_direct = False     # Whether jobs loading their own results INSERT them direct-path. See init_worker()
+
+def main(client, customer_ids, date_range, campaign_status, database, batch_size = ORACLE_BATCH_SIZE,
+         max_pending = MAX_PENDING, extraction = EXTRACTION_DEFAULT, engine = ENGINE_DEFAULT,
+         concurrency = ASYNC_CONCURRENCY, executor = EXECUTOR_DEFAULT, adaptive = False, min_concurrency = 1,
+         rps = None, burst = None, customer_rps = None, customer_burst = None, max_retries = MAX_RETRIES,
+         backoff_base = BACKOFF_BASE, backoff_cap = BACKOFF_CAP, retry_budget = None, timeout = SEARCH_TIMEOUT,
+         stall_timeout = STALL_TIMEOUT, hedge = False, state_db = STATE_DB_FILE, plan = False, shard_days = None,
+         split_rows = None, incremental = False, restatement_days = RESTATEMENT_DAYS, cache_dir = None,
+         cache_max_bytes = CACHE_MAX_BYTES, cache_final_days = CACHE_FINAL_DAYS, resume = None,
+         rerun_failures = None, spool = False, n_loaders = LOADERS, load_in_workers = False, merge = False,
+         direct = False, runs_keep_days = RUNS_KEEP_DAYS):
     """The main method that creates all necessary entities for the example.
     Args: client: an initialized GoogleAdsClient instance.
           customer_ids: an array of client customer IDs.
+          batch_size: number of rows sent to Oracle per .executemany() round trip.
+          max_pending: max number of jobs submitted to the pool whose results haven't been loaded yet.
+          extraction: one of EXTRACTION_MODES. See iter_search_batches().
+          engine: one of ENGINES.
+          concurrency: max number of concurrent requests of the 'asyncio' engine.
+          executor: one of EXECUTORS, for the 'pool' engine.
+          adaptive: whether to adapt the number of requests in flight to quota errors and latency, between
+              min_concurrency and max_pending (concurrency, for the 'asyncio' engine). See throttling.py.
+          rps, burst: max requests per sec (None for no limit), and max requests issued at once. See RateLimiter.
+          customer_rps, customer_burst: same as rps and burst, for each customer on its own.
+          max_retries, backoff_base, backoff_cap, retry_budget: how failed requests get retried. See RetryPolicy.
+              retry_budget defaults to RETRY_BUDGET_RATIO of the jobs.
+          timeout: deadline of every search_stream() call, in secs.
+          stall_timeout: secs without a batch after which a job gets flagged as stalled ('pool' engine only).
+          hedge: whether to hedge straggling jobs ('pool' engine only). See stream_events().
+          state_db: the state store's SQLite file, where every job's stats get recorded. See state_store.py.
+          plan: just print the predicted schedule, without running anything.
+          shard_days: split date_range into shards of up to shard_days days, each one queried, loaded and
+              committed on its own. None for a single shard.
+          split_rows: jobs predicted to be bigger than split_rows rows get split by campaign, in parts of
+              around split_rows rows. None to never split them. See generate_inputs().
+          incremental: fetch, for every customer and query, only the days after the last one fully loaded into
+              database with campaign_status (date_range.start if none has been yet), plus the last restatement_days
+              days, replacing whatever was loaded of them of the campaigns with campaign_status now (i.e.: the ones
+              fetched again). See incremental_date_range().
+          cache_dir: the response cache's directory, where requests for final dates (cache_final_days days ago or
+              before) get cached, up to cache_max_bytes. None for no cache. See response_cache.py.
+          resume: the RUN_ID of an interrupted run to resume: only its tasks of customer_ids that didn't get
+              committed get run, as they were planned (date_range and the like are ignored), into the same
+              database. Its watermarks are left as they were. None for a new run. See run_manifest.py.
+          rerun_failures: the failures file of a run: only its failed tasks of customer_ids get run (as a new run),
+              just like resume does. None for a new run. See run_manifest.read_failures().
+          spool: whether workers pass their results along through spool files in the run's directory, instead
+              of the events queue ('pool' engine only). See spool.py.
+          n_loaders: number of threads loading results into the database, each one in sessions of its own.
+          load_in_workers: whether workers load (and commit) their results themselves, each one in sessions of
+              its own, and only pass along how many got loaded, instead of the loaders ('pool' engine only, not
+              along with spool). Jobs go from PLANNED straight to COMMITTED in the manifest.
+          merge: whether results get INSERTed into a staging table first, and then MERGEd into their dbtable
+              on its natural key, so that rows loaded again (e.g.: by a re-run) replace the ones already
+              loaded instead of being duplicated. See create_staging_tables() and build_merge_sql().
+          direct: whether every job's results get INSERTed direct-path, all at once, right before committing,
+              skipping undo (and redo, for NOLOGGING tables). Meant for big backfills, sharded (every job
+              is held in memory until then). Not along with merge, nor incremental. See begin_load().
+          runs_keep_days: days the directories of runs done are kept for (see run_manifest.prune_runs()). None
+              to keep them all.
     """
     # Output some diagnostic information:
     printout("customer_ids:", ', '.join(customer_ids))
@@ -125,20 +244,23 @@ def main(client, customer_ids, date_range, campaign_status, database):
     ad_performance_select_str = ', '.join((i for i in ad_performance_select_fields))
     keywords_performance_select_str = ', '.join((i for i in keywords_performance_select_fields))
 
-    # Compute GAQL date range string
-    date_range_str = ( "DURING TODAY" if (date_range.start == date_range.end) 
-                 else f"BETWEEN '{date_range.start.isoformat()}' AND '{date_range.end.isoformat()}'" )
-    printout("date_range_str: ", date_range_str)
-
+    # The queries below are templates: each shard's GAQL date range string gets filled in as {date_range} 
+    # (see shard_queries()), and each part's campaigns as {campaigns} (see generate_inputs())
     # Define the GAQL query strings to run for each customer ID.
     # Keywords Performance is the old category 
     keywords_performance_query = { 
         "name": "keywords_performance",
         "dbschema": keywords_performance_dbschema,
         "dbtable": "ITZ_MKT_KEY",
+        # Natural key of the rows, for merged loads. NOTE: the same keyword text can be in an ad group
+        # with different match types. NOTE: campaigns and ad groups go by name, not ID: rows of a renamed one
+        # don't replace the ones loaded under its old name, and rows sharing a key within a job (e.g.: a keyword
+        # removed and added back the same day) get deduplicated before merging (see build_merge_sql())
+        "key": ("customer.id", "segments.date", "segments.device", "campaign.name", "ad_group.name",
+                "ad_group_criterion.keyword.text", "ad_group_criterion.keyword.match_type"),
         "query": f'SELECT {keywords_performance_select_str} ' 
                  f'FROM keyword_view '
-                 f'WHERE segments.date {date_range_str} AND campaign.status = {campaign_status} '
+                 f'WHERE segments.date {{date_range}} AND campaign.status = {campaign_status}{{campaigns}} '
                  f'ORDER BY metrics.clicks DESC'    # Ordering it by metric.clicks in DESCending order because why not
     }
     
@@ -146,218 +268,1302 @@ def main(client, customer_ids, date_range, campaign_status, database):
         "name": "ad_performance", 
         "dbschema": ad_performance_dbschema,
         "dbtable" : "ITZ_MKT_ADS",
+        "key": ("customer.id", "segments.date", "segments.device", "campaign.name", "ad_group.name",
+                "ad_group_ad.ad.id"),
         "query": f'SELECT {ad_performance_select_str} '
                  f'FROM ad_group_ad '
-                 f'WHERE segments.date {date_range_str} AND campaign.status = {campaign_status} '
+                 f'WHERE segments.date {{date_range}} AND campaign.status = {campaign_status}{{campaigns}} '
                  f"ORDER BY metrics.clicks DESC"    # ... idem
     }
 
-    inputs = generate_inputs(client, customer_ids, [keywords_performance_query, ad_performance_query])
+    templates = {q["name"]: q for q in (keywords_performance_query, ad_performance_query)}
+    store = StateStore(state_db)
+    date_ranges = {}    # Fetched by the run, by (customer_id, query name). See update_watermarks()
+    if resume or rerun_failures:
+        # Resume an interrupted run, replaying its unfinished tasks... or re-run the failed ones of a run that
+        # finished. Either way, just as they were planned
+        if resume:
+            manifest = RunManifest(resume)
+            run, tasks = manifest.run, manifest.unfinished()
+        else:
+            run, tasks = read_failures(rerun_failures)
+        if run["database"] != database:
+            printerr(f"RUN_ID {run['run_id']} loads into database {run['database']}, not {database}")
+            store.close()
+            if resume:
+                manifest.close()
+            return
+        incremental = run["incremental"]
+        campaign_status = run.get("campaign_status", campaign_status)
+        inputs = [(task["customer_id"], dict(templates[task["query_name"]], query = task["query"],
+                                             shard = tuple(task["shard"]), part = tuple(task["part"])))
+                  for task in tasks if task["customer_id"] in customer_ids]
+        inputs = sorted(inputs, key = lambda args: -predicted_duration(store, *args))
+        queries = {(q["name"], q["shard"]): q for _, q in inputs}
+        printout(f"{'RESUMING' if resume else 'RE-RUNNING FAILURES OF'} RUN_ID: {run['run_id']} "
+                 f"// {len(inputs)} tasks to run of {len(tasks)}")
+    else:
+        # The date range of every (customer_id, query name): the whole date range... or just what's missing
+        for customer_id, query_name in product(customer_ids, templates):
+            job_range = date_range
+            if incremental:
+                watermark = store.watermark(database, customer_id, query_name, campaign_status)
+                job_range = incremental_date_range(date_range, watermark, restatement_days)
+                printout(f"INCREMENTAL: customer_id : {customer_id} // query_name : {query_name} "
+                         f"// loaded through : {watermark} // " + 
+                         (f"dates : {job_range.start}..{job_range.end}" if job_range else "up to date"))
+            if job_range:
+                date_ranges[customer_id, query_name] = job_range
+        # ... split into shards, a job each
+        jobs = [(customer_id, query) for (customer_id, query_name), job_range in date_ranges.items()
+                for query in shard_queries([templates[query_name]], shard_dates(job_range, shard_days))]
+        printout(f"SHARDS: {len(jobs)} jobs // " + (f"Up to {shard_days} days each" if shard_days else "One per date range"))
+        # One query per shard, by (name, shard)
+        queries = {(q["name"], q["shard"]): q for _, q in jobs}
+        # Biggest jobs first, as far as previous runs tell, so that no big job is left for last...
+        # ... and, if the biggest ones are too big, split them by campaign. Only their campaigns need to be fetched
+        big_customer_ids = sorted({customer_id for customer_id, query in jobs
+                                   if split_rows and predicted_rows(store, customer_id, query) > split_rows})
+        # NOTE: planning stays offline: parts are just assumed, without fetching any campaigns
+        campaigns = None if plan else fetch_campaigns(client, big_customer_ids, campaign_status)
+        inputs = generate_inputs(jobs, store, campaigns, split_rows)
+    if plan:
+        n_workers = concurrency if engine == 'asyncio' else (MAX_THREADS if executor == 'thread' else MAX_PROCESSES)
+        print_plan(inputs, store, min(n_workers, concurrency if engine == 'asyncio' else max_pending))
+        store.close()
+        if resume:
+            manifest.close()
+        return
+    if not resume:  # Every task gets recorded as it goes, so that the run can be resumed if interrupted
+        manifest = RunManifest()
+        manifest.start(database = database, incremental = incremental, campaign_status = campaign_status)
+        for customer_id, query in inputs:
+            manifest.record(PLANNED, customer_id, query)
+        printout(f"RUN_ID: {manifest.run_id} // Manifest: {manifest.file}")
     
-    with multiprocessing.Pool(MAX_PROCESSES) as pool:
-        # Call issue_search_request on each input, parallelizing the work across processes in the pool.
-        results = pool.starmap(issue_search_request, inputs)
-        
-        # Partition our results into successful and failed results.
-        successes = []
-        failures = []
-        for res in results:
-            if res[0]:
-                successes.append(res[1])    # Everything on this list... commit to database
+    # DB: Connect to the database BEFORE fetching anything, so that each batch gets loaded as soon as it
+    # arrives, overlapping database work with the fetching still in progress. Batches of different jobs
+    # arrive interleaved, so each job in flight gets its own session (i.e.: its own transaction) from the pool.
+    max_in_flight = concurrency if engine == 'asyncio' else max_pending
+    # Start halfway, and let the limit find its own way from there
+    controller = AdaptiveConcurrency(max_in_flight // 2, max_in_flight, min_concurrency, log = printout) if adaptive else None
+    # Every worker, wherever it runs, draws its requests from the same token buckets
+    limiter = RateLimiter(rps, burst, customer_ids, customer_rps, customer_burst) if rps or customer_rps else None
+    # ... and every retry from the same budget
+    if retry_budget is None:
+        retry_budget = max(max_retries, round(len(inputs) * RETRY_BUDGET_RATIO))
+    retry_policy = RetryPolicy(max_retries, backoff_base, backoff_cap, retry_budget)
+    # Requests already fetched by previous runs (e.g.: loaded into another database) get read from disk instead
+    cache = ResponseCache(cache_dir, cache_max_bytes, cache_final_days) if cache_dir else None
+    # Restated days get replaced... but only rows of campaigns with campaign_status now, the ones fetched again:
+    # rows of campaigns whose status changed since they were loaded stay as they were
+    replace = fetch_campaigns(client, sorted({customer_id for customer_id, _ in inputs}), campaign_status,
+                              "name") if incremental else None
+    # Results loaded by the workers themselves never leave them: there's no need for loaders at all
+    if load_in_workers:
+        n_loaders = 0
+    # Results, if spooled, go through the disk: the events queue only carries where to read them from
+    spool_dir = os.path.join(manifest.dir, 'spool') if spool and not load_in_workers else None
+    if spool_dir:
+        os.makedirs(spool_dir, exist_ok = True)
+    successes = []  # NOTE: only a summary of each job is kept. Its results are dropped once loaded
+    failures = []
+    first_failed = {}   # Start date of the first failed shard, by (customer_id, query name). See update_watermarks()
+    with closing(store), closing(manifest), ExitStack() as stack:
+        # Worker processes loading their own results connect on their own (see init_worker())
+        session_pool = None if load_in_workers and executor == 'process' else \
+                       stack.enter_context(closing(create_session_pool(database, max_in_flight)))
+        if merge:   # NOTE: DDL, if the staging tables are missing. Before anything gets loaded
+            create_staging_tables(session_pool or stack.enter_context(closing(create_session_pool(database, 1))),
+                                  templates.values())
+        # Jobs push their results downstream batch by batch through `events` (see issue_search_request()),
+        # a bounded queue: when the loader falls behind, jobs block instead of piling up results in memory
+        settings = WorkerSettings(extraction = extraction, client = client, limiter = limiter,
+                                  retry_policy = retry_policy, timeout = timeout, cache = cache, spool_dir = spool_dir,
+                                  batch_size = batch_size, replace = replace, merge = merge, direct = direct)
+        if engine == 'asyncio':
+            # Run every job as a coroutine, all of them in a single thread over a single gRPC channel
+            events = queue.Queue(max_pending)
+            event_stream = stream_events_async(client, inputs, events, concurrency, extraction, controller, limiter,
+                                               retry_policy, timeout, cache)
+        elif executor == 'thread':
+            # Call issue_search_request on each input, parallelizing the work across threads. Every thread
+            # shares the same GoogleAdsService (i.e.: the same gRPC channel): no pickling, no process start-up
+            events = queue.Queue(max_pending)
+            init_worker(events, settings._replace(claims = {} if hedge else None,
+                                                  loads_into = session_pool if load_in_workers else None))
+            pool = stack.enter_context(ThreadPoolExecutor(MAX_THREADS))
+            event_stream = stream_events(pool, issue_search_request, inputs, events, max_pending, controller,
+                                         stall_timeout, hedge)
+        else:
+            # Call issue_search_request on each input, parallelizing the work across processes in the pool.
+            # The client gets pickled to each process just once, and its GoogleAdsService built just once
+            events = multiprocessing.Queue(max_pending)
+            claims = stack.enter_context(multiprocessing.Manager()).dict() if hedge else None
+            pool = stack.enter_context(ProcessPoolExecutor(MAX_PROCESSES, initializer = init_worker,
+                                                           initargs = (events, settings._replace(
+                                                               claims = claims,
+                                                               loads_into = database if load_in_workers else None))))
+            event_stream = stream_events(pool, issue_search_request, inputs, events, max_pending, controller,
+                                         stall_timeout, hedge)
+
+        # Load results as they come on n_loaders threads, each one with jobs of its own: every job gets loaded
+        # (and committed) by a single loader, in its own transaction, while other loaders load other jobs
+        loaded = queue.Queue()      # Jobs done loading. See run_loader()
+        loader_queues = [queue.Queue(max_pending) for _ in range(n_loaders)]
+        loaders = [threading.Thread(target = run_loader, args = (session_pool, queries, loader_queue, loaded, manifest,
+                                                                 batch_size, replace, spool_dir, merge,
+                                                                 direct))
+                   for loader_queue in loader_queues]
+        for loader in loaders:
+            loader.start()
+        owners = {}                 # Loader of every job being loaded, by task_key
+        n_owned = [0] * n_loaders   # N of jobs being loaded, by loader
+
+        def account(task_key, ok, job, load):
+            """Partitions the jobs done loading into successful and failed results"""
+            if task_key is None:    # A loader went awfully wrong
+                raise load
+            summary = {"customer_id": job["customer_id"],
+                       "query":       job["query"],
+                       "n_results":   job["n_results"],
+                       "n_inserted":  load["n_inserted"] if load else 0,
+                       "n_rejected":  load["n_rejected"] if load else 0,
+                       "elapsed":     job["elapsed"],
+                       "n_throttled": job["n_throttled"],
+                       "cached":      job["cached"],}
+            if ok:
+                if not job["cached"]:   # Cached jobs take no time at all: they say nothing about fetching them
+                    n_parts = job["query"]["part"][1]    # NOTE: parts are assumed to be alike
+                    store.record(job["customer_id"], job["query"]["name"], job["n_results"] * n_parts,
+                                 job["elapsed"] * n_parts, shard_length(job["query"]["shard"]))
+                if load_in_workers:     # Loader threads record it themselves, as soon as it's committed
+                    manifest.record(COMMITTED, job["customer_id"], job["query"], n_inserted = summary["n_inserted"])
+                successes.append(summary)
             else:
-                failures.append(res[1])     # Potential errors to be dealt with
-
-        # Output results summary
-        # How many, and which jobs succeded -- make it explicit
-        printout(f"Total successful results: {len(successes)}\n")
-        if successes:
-            printout("Successes:")
-            for success in successes:
-                printout(f'\tcustomer_id : {success["customer_id"]} '
-                         f'// query_name : {success["query"]["name"]} '
-                         f'// # results : {len(success["results"])}')
-        
-        # How many, and which jobs failed -- make it explicit
-        printout(f"Total failed results: {len(failures)}\n")
-        if failures:
-            printout("Failures:")
-            for failure in failures:
-                printout(f'\tcustomer_id : {failure["customer_id"]} // query_name : {failure["query"]["name"]}')
-        
-        # DB: Connect to the database:
-        # DB: ... loading database configuration
-        printout("Loading database configuration from", DB_CONFIG_FILE)
-        with open(DB_CONFIG_FILE) as f:
-            dbs = json.load(f)
-        base = dbs[database]
-        
-        # DB: ... connecting to the database
-        printout("Connecting to Database...")
-        printout(f'\tHost: {base["host"]} / Port: {base["port"]} / ServiceName: {base["database"]}')
-        printout(f"\tUser: {base['user2']}")
-        dsn_tns = cx_Oracle.makedsn(base['host'], base['port'], service_name = base['database'])
-        
-        with cx_Oracle.connect(user = base['user2'], password = base['passwd'], dsn = dsn_tns) as conn:
-            # DB: ...building database cursor
-            cursor = conn.cursor()
-
-            for success in successes:
-                dbschema = success["query"]["dbschema"]     # "pointer" to successful job's corresponding dbschema
-                dbtable_name = success["query"]["dbtable"]  # ... to database table name
-                query_name = success["query"]["name"]
-                customer_id = success["customer_id"]
-
-                results = success["results"]                # ... a list of GoogleAdsRow objects
-
-                gaql_cols_names = [col[0] for col in dbschema]  # dbschema guarantees for these two to have a one-to-one
-                sql_cols_names = [col[1] for col in dbschema]   # correspondence or it should anyway... FIXME: and there are 
-                                                                # non-corresponding fields due to 'fossil' columns in the database
-
-                sql_insert_string = (   # Construct Oracle SQL on-the-fly according to the corresponding dbschema
-                        'INSERT INTO ' + dbtable_name + ' ' +
-                        '(' + ', '.join(sql_cols_names) + ', FECHA_CREACION) ' +
-                        'VALUES ' +
-                        '(' + ', '.join((":" + str(i) for i, _ in enumerate(sql_cols_names, start = 1))) + ', SYSDATE)' 
-                    ) # in .join'ing the sql_cols_names names, could use range(), but enumerate() makes it more explicit
-
-                n_results = len(results)    # I prefer explicit pre-calculation to implicit compiler optimization cuz' issues...
-                for i, result in enumerate(results):
-                    fields_vals_list = []
-                    for field in gaql_cols_names:
-                        f = get_field(result, field)    # retrieves GAQL `field` from `result`: see get_field() definition
-                        # NOTE: for 'plurals', GoogleAds return a list. If it's not a list, stringify. If it is a list AND
-                        #    it ain't empty, stringify it's first element. If it is empty, settle for a stringified 'None'
-                        f = (str(f[0]) if len(f) > 0 else str(None)) if isinstance(f, list) else str(f)
-                        fields_vals_list.append(f)
-                    try:
-                        cursor.execute(sql_insert_string, fields_vals_list)     # TODO: Use cursor.executemany() for performance
-                        printout(f"Executing INSERT {i+1}/{n_results}")
-                        printout('dbtable_name:', dbtable_name, '// query:', query_name, '// For client_id:', customer_id)
-                    except Exception as e:
-                        printerr(f'For <{i}/{n_results}>', '=' * 40)
-                        printerr(f"\tFAILED INSERT {i}/{n_results}!!!")
-                        printerr('\tdbtable_name:', dbtable_name, '// query:', query_name, '// For client_id:', customer_id)
-                        printerr('-' * 40)
-                        printerr("sql_insert_string>\n\t", sql_insert_string)
-                        printerr("fields_vals_list>\n\t", fields_vals_list)
-                conn.commit()
-
-        # TODO: Improve error Management
-        printerr("Failures:") if len(failures) else None
+                manifest.record(FAILED, job["customer_id"], job["query"], error = job["error"]["status"])
+                failures.append(dict(job, **summary))   # Potential errors to be dealt with
+                key = (job["customer_id"], job["query"]["name"])
+                first_failed[key] = min(first_failed.get(key, '9999-12-31'), job["query"]["shard"][0])
+
+        try:
+            for event, task_key, payload in event_stream:
+                if load_in_workers:     # Already loaded (and committed, if ok) by the worker itself
+                    if event == "done":
+                        account(task_key, *payload, payload[1]["load"])
+                    continue
+                if task_key not in owners:  # A new job goes to the loader with the fewest
+                    owners[task_key] = min(range(n_loaders), key = n_owned.__getitem__)
+                    n_owned[owners[task_key]] += 1
+                owner = owners[task_key] if event == "results" else owners.pop(task_key)
+                if event == "done":
+                    n_owned[owner] -= 1
+                loader_queues[owner].put((event, task_key, payload))
+                while not loaded.empty():
+                    account(*loaded.get())
+        except BaseException:
+            # Something went awfully wrong (e.g.: the database went away): jobs not started yet never will, and
+            # jobs in flight get to finish, their events going nowhere, so that the pool can shut down
+            if engine == 'pool':
+                pool.shutdown(wait = False, cancel_futures = True)
+            threading.Thread(target = drain_events, args = (events, ), daemon = True).start()
+            raise
+        finally:
+            for loader_queue in loader_queues:
+                loader_queue.put(None)
+            for loader in loaders:
+                loader.join()
+        while not loaded.empty():
+            account(*loaded.get())
+        if incremental:
+            update_watermarks(store, database, campaign_status, date_ranges, first_failed)
+        if spool_dir and not os.listdir(spool_dir):
+            os.rmdir(spool_dir)
+
+    # Output results summary
+    # How many, and which jobs succeded -- make it explicit
+    printout(f"Total successful results: {len(successes)}\n")
+    if successes:
+        printout("Successes:")
+        for success in successes:
+            printout(f'\tcustomer_id : {success["customer_id"]} '
+                     f'// query_name : {success["query"]["name"]} '
+                     f'// {task_label(success["query"])} '
+                     f'// # results : {success["n_results"]} '
+                     f'// # inserted : {success["n_inserted"]} '
+                     f'// # rejected : {success["n_rejected"]} '
+                     f'// elapsed : {success["elapsed"]:.2f}s')
+    
+    # How many, and which jobs failed -- make it explicit
+    printout(f"Total failed results: {len(failures)}\n")
+    if failures:
+        printout("Failures:")
         for failure in failures:
-            ex = failure["exception"]
-            printerr(f'Request with ID "{ex.request_id}" failed with status '
-                     f'"{ex.error.code().name}" for customer_id '
-                     f'{failure["customer_id"]} and query "{failure["query"]}" and '
-                      "includes the following errors:" )
-            for error in ex.failure.errors:
-                printerr(f'\tError with message "{error.message}".')
-                if error.location:
-                    for field_path_element in error.location.field_path_elements:
-                        printerr(f"\t\tOn field: {field_path_element.field_name}")
-
-
-def issue_search_request(client, customer_id, query):
+            printout(f'\tcustomer_id : {failure["customer_id"]} // query_name : {failure["query"]["name"]} '
+                     f'// {task_label(failure["query"])}')
+    printout(f"Retries: {retry_policy.n_retries} // Retry budget: {retry_budget}")
+    if failures:
+        failures_file = manifest.write_failures(failures)
+        printout(f"Failures written to: {failures_file} // To re-run them: --rerun_failures {failures_file}")
+    if cache:
+        n_files, n_bytes = cache.evict()
+        printout(f"Cache hits: {sum(success['cached'] for success in successes)} "
+                 f"// Evicted: {n_files} cached requests ({n_bytes / 1024 ** 2:.1f} MB)")
+    if controller:
+        printout(f"Throttled jobs: {controller.n_throttled} // Final concurrency limit: {controller.limit}")
+    if runs_keep_days is not None:
+        printout(f"Runs done more than {runs_keep_days} days ago removed: {len(prune_runs(runs_keep_days))}")
+
+    # TODO: Improve error Management
+    printerr("Failures:") if len(failures) else None
+    for failure in failures:
+        ex = failure["error"]
+        printerr(f'Request with ID "{ex["request_id"]}" failed with status '
+                 f'"{ex["status"]}" for customer_id '
+                 f'{failure["customer_id"]} and query "{failure["query"]}" and '
+                  "includes the following errors:" )
+        for error in ex["errors"]:
+            printerr(f'\tError with message "{error["message"]}".')
+            for field_name in error["fields"]:
+                printerr(f"\t\tOn field: {field_name}")
+
+
+def run_loader(session_pool, queries, jobs, loaded, manifest, batch_size = ORACLE_BATCH_SIZE, replace = None,
+               spool_dir = None, merge = False, direct = False):
+    """Loader thread: loads every job pushed to it, event by event, in the order they were pushed. Every
+    ("results", task_key, results) event gets its batch INSERTed in its job's own transaction, and every
+    ("done", task_key, (ok, job)) event gets it committed (or rolled back), and the job pushed to loaded as a
+    (task_key, ok, job, load) tuple. Jobs the database refuses to commit (see end_load()) get pushed as failed.
+    Exits on a None.
+    If something goes awfully wrong (e.g.: the database goes away), the exception gets pushed to loaded as a
+    (None, None, None, exception) tuple, everything in progress gets rolled back, and everything else pushed
+    to the loader gets discarded (until the None), so that whoever pushes it never blocks.
+    Args: session_pool: a cx_Oracle.SessionPool.
+          queries: the queries, as defined in main(), by (name, shard).
+          jobs: a queue.Queue of (event, task_key, payload) events, as yielded by stream_events().
+          loaded: a queue.Queue where jobs done loading are pushed.
+          manifest: the run's RunManifest, where jobs get recorded as LOADED before they're committed, and as
+              COMMITTED as soon as they are.
+          batch_size: max number of rows per .executemany() call.
+          replace: the names of the campaigns whose rows loads replace, by customer_id (see begin_load()). None
+              to not replace anything.
+          spool_dir: the directory where workers spool their results to, if they do (see spool.py).
+          merge: whether loads get merged through a staging table (see begin_load()).
+          direct: whether loads get INSERTed direct-path (see begin_load()).
+    """
+    loads = {}      # In progress loads, by task_key
+    try:
+        while (item := jobs.get()) is not None:
+            event, task_key, payload = item
+            if event == "results":
+                if task_key not in loads:
+                    customer_id, query_name, shard, part = task_key
+                    loads[task_key] = begin_load(session_pool, customer_id, dict(queries[query_name, shard], part = part),
+                                                 replace and replace[customer_id], merge, direct)
+                load_batch(loads[task_key], read_batch(payload) if spool_dir else payload, batch_size)
+                continue
+
+            # event == "done": every batch of the job has been loaded (or it failed)
+            ok, job = payload
+            load = loads.pop(task_key, None)
+            if ok and not load and replace and replace[job["customer_id"]]:    # No rows at all: what was loaded goes, still
+                load = begin_load(session_pool, job["customer_id"], job["query"], replace[job["customer_id"]], merge,
+                                  direct)
+            if ok:
+                manifest.record(LOADED, job["customer_id"], job["query"], n_results = job["n_results"])
+            # Commit to database right away... or discard partial results of a failed job
+            if load and (ex := end_load(session_pool, load, commit = ok)):     # Refused by the database
+                ok, job = False, dict(job, error = describe_exception(ex))
+            if ok:      # Right away too: were the run to die now, the job must not get loaded twice on --resume
+                manifest.record(COMMITTED, job["customer_id"], job["query"], n_inserted = load["n_inserted"] if load else 0)
+            if spool_dir and os.path.exists(spool_file(spool_dir, task_key)):
+                os.remove(spool_file(spool_dir, task_key))
+            loaded.put((task_key, ok, job, load))
+    except BaseException as ex:
+        loaded.put((None, None, None, ex))
+        for load in loads.values():
+            end_load(session_pool, load, commit = False)
+        loads.clear()
+        while jobs.get() is not None:
+            pass
+    finally:
+        for load in loads.values():     # Only left behind if something went awfully wrong
+            end_load(session_pool, load, commit = False)
+
+def create_session_pool(database, max_sessions):
+    """Creates a pool of sessions to one of the databases specified in DB_CONFIG_FILE.
+    Args: database: key of the database in DB_CONFIG_FILE.
+          max_sessions: max number of sessions open at the same time.
+    Returns: a cx_Oracle.SessionPool.
+    """
+    # DB: ... loading database configuration
+    printout("Loading database configuration from", DB_CONFIG_FILE)
+    with open(DB_CONFIG_FILE) as f:
+        dbs = json.load(f)
+    base = dbs[database]
+    
+    # DB: ... connecting to the database
+    printout("Connecting to Database...")
+    printout(f'\tHost: {base["host"]} / Port: {base["port"]} / ServiceName: {base["database"]}')
+    printout(f"\tUser: {base['user2']}")
+    dsn_tns = cx_Oracle.makedsn(base['host'], base['port'], service_name = base['database'])
+    
+    return cx_Oracle.SessionPool(user = base['user2'], password = base['passwd'], dsn = dsn_tns,
+                                 min = 1, max = max_sessions, increment = 1, threaded = True,
+                                 getmode = cx_Oracle.SPOOL_ATTRVAL_WAIT)
+
+def begin_load(session_pool, customer_id, query, replace = None, merge = False, direct = False):
+    """Starts loading the results of a job: acquires a session (i.e.: a transaction of its own) and
+    prepares the INSERT statement according to the job's dbschema.
+    Args: session_pool: a cx_Oracle.SessionPool.
+          customer_id: the job's client customer ID str.
+          query: the job's query, as defined in main().
+          replace: the names of the campaigns whose rows (of the job's customer and shard) get DELETEd first,
+              in the same transaction: the job's rows replace them once committed, or they stay if rolled back.
+              None (or empty) to not DELETE anything.
+          merge: whether to INSERT into the dbtable's staging table instead, to be MERGEd into the dbtable
+              right before committing (see end_load()).
+          direct: whether to INSERT direct-path (/*+ APPEND_VALUES */): above the table's high water mark,
+              without undo (nor redo, if the table is NOLOGGING). NOTE: once a transaction has INSERTed
+              direct-path into a table, it can't touch it again until it commits (ORA-12838), so every batch
+              gets held on to, and the whole job INSERTed at once right before committing (see end_load()).
+              NOTE: direct-path INSERTs lock the whole table, so loads into the same table take turns. Not
+              along with replace: a load holding its DELETE's row locks while waiting on another one's INSERT to
+              commit, which in turn waits on those rows, deadlocks (ORA-00060).
+    Returns: a load, a dict to be passed along to load_batch() and end_load().
+    """
+    conn = session_pool.acquire()
+    cursor = conn.cursor()
+    n_deleted = delete_rows(cursor, customer_id, query, replace) if replace else 0
+    return {"customer_id":       customer_id,
+            "query":             query,
+            "conn":              conn,
+            "cursor":            cursor,
+            "sql_insert_string": build_insert_sql(staging_table(query["dbtable"]) if merge else query["dbtable"],
+                                                  query["dbschema"], direct),
+            "sql_merge_string":  build_merge_sql(query["dbtable"], query["dbschema"], query["key"]) if merge else None,
+            "n_results":         0,
+            "n_inserted":        0,
+            "n_rejected":        0,
+            "n_deleted":         n_deleted,
+            "n_merged":          None,
+            "rows":              [] if direct else None,}     # Held on to until committing, if direct
+
+def load_batch(load, results, batch_size = ORACLE_BATCH_SIZE):
+    """INSERTs a batch of results into the load's dbtable. Does NOT commit. Rows come already extracted
+    by the workers (see iter_search_batches()): all that's left to do here is database I/O.
+    Args: load: a load as returned by begin_load().
+          results: a list of rows of bind values, in the load's dbschema order.
+          batch_size: max number of rows per .executemany() call.
+    """
+    load["n_results"] += len(results)
+    if load["rows"] is not None:    # Direct-path: INSERTed all at once (see end_load())
+        load["rows"].extend(results)
+        return
+    n_inserted, n_rejected = load_rows(load["cursor"], load["sql_insert_string"], results, batch_size)
+    load["n_inserted"] += n_inserted
+    load["n_rejected"] += n_rejected
+
+def end_load(session_pool, load, commit = True):
+    """Finishes a load, either commiting or rolling back everything INSERTed, and releases its session.
+    Merged loads get MERGEd from their staging table into their dbtable first, in the same transaction, and
+    direct-path loads get every row held on to INSERTed, in a single .executemany() call.
+    If the database refuses to commit the job (e.g.: a direct-path INSERT with a rejected row, or a MERGE with
+    duplicated keys), it gets rolled back, so that only that job fails. If even rolling back fails (e.g.: the
+    database went away), it raises.
+    Args: session_pool: the cx_Oracle.SessionPool the load's session was acquired from.
+          load: a load as returned by begin_load().
+          commit: whether to commit (True) or rollback (False).
+    Returns: the cx_Oracle.DatabaseError the job was refused with, if it was. None otherwise.
+    """
+    customer_id, query_name, dbtable_name = load["customer_id"], load["query"]["name"], load["query"]["dbtable"]
+    label = task_label(load["query"])
+    try:
+        if commit:
+            try:
+                if load["rows"]:
+                    # NOTE: no batcherrors for direct-path INSERTs (ORA-38910): a single rejected row fails them all
+                    load["n_inserted"], load["n_rejected"] = load_rows(load["cursor"], load["sql_insert_string"],
+                                                                       load["rows"], len(load["rows"]),
+                                                                       batcherrors = False)
+                    load["rows"] = []
+                if load["sql_merge_string"]:
+                    load["cursor"].execute(load["sql_merge_string"])
+                    load["n_merged"] = load["cursor"].rowcount
+                load["conn"].commit()
+            except cx_Oracle.DatabaseError as ex:
+                load["rows"] = []
+                load["conn"].rollback()
+                printerr(f'FAILED dbtable_name: {dbtable_name} // query: {query_name} // For client_id: {customer_id} '
+                         f'// {label} // Discarded {load["n_results"]} rows // {ex}')
+                return ex
+            printout(f'COMMITTED dbtable_name: {dbtable_name} // query: {query_name} // For client_id: {customer_id} '
+                     f'// {label} // Inserted {load["n_inserted"]}/{load["n_results"]} rows // Rejected {load["n_rejected"]}'
+                     + (f' // Replaced {load["n_deleted"]}' if load["n_deleted"] else '')
+                     + (f' // Merged {load["n_merged"]}' if load["n_merged"] is not None else ''))
+        else:
+            load["conn"].rollback()
+            printerr(f'ROLLED BACK dbtable_name: {dbtable_name} // query: {query_name} // For client_id: {customer_id} '
+                     f'// {label} // Discarded {load["n_inserted"]} rows')
+    finally:
+        session_pool.release(load["conn"])
+
+def build_insert_sql(dbtable_name, dbschema, direct = False):
+    """Constructs Oracle SQL INSERT statement on-the-fly according to the corresponding dbschema.
+    Bind variables are numbered from 1, in dbschema order, so a row is just a sequence of values.
+    Args: dbtable_name: name of the table to INSERT INTO.
+          dbschema: a tuple of (gaql_field, sql_column) pairs.
+          direct: whether to hint the INSERT to go direct-path (/*+ APPEND_VALUES */). NOTE: Oracle silently
+              goes conventional path instead if the table doesn't allow it (e.g.: it has triggers).
+    """
+    sql_cols_names = [col[1] for col in dbschema]
+    return ( 'INSERT ' + ('/*+ APPEND_VALUES */ ' if direct else '') + 'INTO ' + dbtable_name + ' ' +
+             '(' + ', '.join(sql_cols_names) + ', FECHA_CREACION) ' +
+             'VALUES ' +
+             '(' + ', '.join((":" + str(i) for i, _ in enumerate(sql_cols_names, start = 1))) + ', SYSDATE)' 
+           ) # in .join'ing the sql_cols_names names, could use range(), but enumerate() makes it more explicit
+
+def build_delete_sql(dbtable_name, dbschema, n_campaigns):
+    """Constructs Oracle SQL DELETE statement of every row of a customer (bind variable :1) between two 
+    dates (:2 and :3, both inclusive, as YYYY-MM-DD strings, just like they get INSERTed) of n_campaigns
+    campaigns, by name (:4 onwards).
+    Args: dbtable_name: name of the table to DELETE FROM.
+          dbschema: a tuple of (gaql_field, sql_column) pairs. Must have customer.id, segments.date and campaign.name.
+          n_campaigns: number of campaigns, up to ORACLE_MAX_IN_LIST.
+    """
+    columns = dict(col for col in dbschema if col[0])
+    return ( f'DELETE FROM {dbtable_name} ' 
+             f'WHERE {columns["customer.id"]} = :1 AND {columns["segments.date"]} BETWEEN :2 AND :3 ' +
+             f'AND {columns["campaign.name"]} IN (' + ', '.join((":" + str(i) for i in range(4, 4 + n_campaigns))) + ')' )
+
+def delete_rows(cursor, customer_id, query, campaigns):
+    """DELETEs every row of a job's customer and shard of the given campaigns, ORACLE_MAX_IN_LIST campaigns at
+    a time. Does NOT commit.
+    Args: cursor: a cx_Oracle cursor.
+          customer_id: the job's client customer ID str.
+          query: the job's query, as defined in main().
+          campaigns: a list of campaign names.
+    Returns: the number of rows deleted.
+    """
+    n_deleted = 0
+    for i in range(0, len(campaigns), ORACLE_MAX_IN_LIST):
+        chunk = campaigns[i:i + ORACLE_MAX_IN_LIST]
+        cursor.execute(build_delete_sql(query["dbtable"], query["dbschema"], len(chunk)),
+                       (customer_id, *query["shard"], *chunk))
+        n_deleted += cursor.rowcount
+    return n_deleted
+
+def build_merge_sql(dbtable_name, dbschema, key):
+    """Constructs Oracle SQL MERGE statement of every row of dbtable_name's staging table (see staging_table())
+    into dbtable_name, on its natural key: rows already there get their columns updated, and the rest get
+    INSERTed, just like build_insert_sql() would.
+    Staged rows sharing a key get deduplicated first, or the MERGE would fail (ORA-30926): only the first one
+    staged is kept (i.e.: the one with the most clicks, as queries are ordered by them).
+    Args: dbtable_name: name of the table to MERGE INTO.
+          dbschema: a tuple of (gaql_field, sql_column) pairs.
+          key: the gaql_fields of the natural key. NOTE: key columns must not be NULL, or rows won't match.
+    """
+    sql_cols_names = [col[1] for col in dbschema]
+    key_cols_names = [col[1] for col in dbschema if col[0] in key]
+    return ( f'MERGE INTO {dbtable_name} t USING (SELECT * FROM (SELECT s.*, ROW_NUMBER() OVER (PARTITION BY ' +
+             ', '.join(key_cols_names) + f' ORDER BY ROWID) AS RN FROM {staging_table(dbtable_name)} s) ' +
+             'WHERE RN = 1) s ' +
+             'ON (' + ' AND '.join((f't.{col} = s.{col}' for col in key_cols_names)) + ') ' +
+             'WHEN MATCHED THEN UPDATE SET ' + 
+             ', '.join((f't.{col} = s.{col}' for col in sql_cols_names if col not in key_cols_names)) + ' ' +
+             'WHEN NOT MATCHED THEN INSERT ' +
+             '(' + ', '.join(sql_cols_names) + ', FECHA_CREACION) ' +
+             'VALUES ' +
+             '(' + ', '.join((f's.{col}' for col in sql_cols_names)) + ', s.FECHA_CREACION)'
+           )
+
+def staging_table(dbtable_name):
+    """Returns: the name of the staging table of a dbtable"""
+    return dbtable_name + STAGING_SUFFIX
+
+def create_staging_tables(session_pool, queries):
+    """Creates the staging table of every query's dbtable, unless it exists already: a global temporary table
+    just like the dbtable, whose rows are private to the session that INSERTed them, and go away as soon as
+    it commits (or rolls back). So every load, in a session of its own, stages its rows on its own.
+    NOTE: DDL commits on its own, so this is meant to be called before anything gets loaded.
+    Args: session_pool: a cx_Oracle.SessionPool.
+          queries: the queries, as defined in main().
+    """
+    conn = session_pool.acquire()
+    try:
+        cursor = conn.cursor()
+        existing = {table_name for table_name, in cursor.execute("SELECT table_name FROM user_tables").fetchall()}
+        for dbtable_name in sorted({query["dbtable"] for query in queries}):
+            if staging_table(dbtable_name) not in existing:
+                printout(f"Creating staging table {staging_table(dbtable_name)} for {dbtable_name}")
+                cursor.execute(f'CREATE GLOBAL TEMPORARY TABLE {staging_table(dbtable_name)} ON COMMIT DELETE ROWS '
+                               f'AS SELECT * FROM {dbtable_name} WHERE 1 = 0')
+    finally:
+        session_pool.release(conn)
+
+def load_rows(cursor, sql_insert_string, rows, batch_size = ORACLE_BATCH_SIZE, batcherrors = True):
+    """Inserts rows using array DML: one .executemany() round trip per batch of batch_size rows.
+    Uses batcherrors so that a rejected row doesn't abort the rest of its batch; rejected rows
+    are reported to stderr along with their Oracle error. Does NOT commit.
+    Args: cursor: a cx_Oracle cursor.
+          sql_insert_string: an INSERT statement with numbered bind variables (see build_insert_sql()).
+          rows: an iterable of sequences of bind values.
+          batch_size: max number of rows per .executemany() call.
+          batcherrors: whether to use batcherrors. NOTE: direct-path INSERTs can't (ORA-38910): without them,
+              a rejected row raises, and none of its batch gets INSERTed.
+    Returns: (n_inserted, n_rejected) tuple.
+    """
+    n_inserted, n_rejected = 0, 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            inserted, rejected = _execute_batch(cursor, sql_insert_string, batch, batcherrors)
+            n_inserted, n_rejected = n_inserted + inserted, n_rejected + rejected
+            batch = []
+    if batch:
+        inserted, rejected = _execute_batch(cursor, sql_insert_string, batch, batcherrors)
+        n_inserted, n_rejected = n_inserted + inserted, n_rejected + rejected
+    
+    return n_inserted, n_rejected
+
+def _execute_batch(cursor, sql_insert_string, batch, batcherrors = True):
+    """Sends a single batch through .executemany(batcherrors = True), reporting rejected rows. Or, if not
+    batcherrors, through a plain .executemany(): nothing gets rejected, it raises instead.
+    Returns: (n_inserted, n_rejected) tuple.
+    """
+    if not batcherrors:
+        cursor.executemany(sql_insert_string, batch)
+        return len(batch), 0
+    cursor.executemany(sql_insert_string, batch, batcherrors = True)
+    errors = cursor.getbatcherrors()
+    for error in errors:
+        printerr('=' * 40)
+        printerr(f"\tFAILED INSERT at batch offset {error.offset}/{len(batch)}: {error.message}")
+        printerr("sql_insert_string>\n\t", sql_insert_string)
+        printerr("fields_vals_list>\n\t", batch[error.offset])
+    
+    return len(batch) - len(errors), len(errors)
+
+def issue_search_request(customer_id, query, retry_count = 0, n_throttled = 0, copy = 0):
     """Issues a search request using streaming.
-    Retries if a GoogleAdsException is caught, until MAX_RETRIES is reached.
+    The job's first event is ("started", task_key, (args, copy)), args being the arguments it was called 
+    with (see stream_events()). Every batch of results is pushed downstream as an ("results", task_key, results)
+    event as soon as it's received, so that no worker ever holds more than one batch of a result set in memory.
+    The job's last event is ("done", task_key, (True|False, job)), job being a dict labelling the job.
+    If a GoogleAdsException (or a gRPC error) is caught, and the worker's RetryPolicy says it's worth
+    retrying (see retry_policy.py), the job's last event is ("retry", task_key, (backoff, args, job))
+    instead: rather than sleeping through the backoff, the worker moves on to the next job, and whoever
+    scheduled it gets to call issue_search_request(*args) again once backoff secs have gone by (see 
+    stream_events()). NOTE: once a batch has been pushed, the job can't be retried without duplicating
+    results downstream, so it fails.
+    A hedged job runs as two copies at once: only the first copy to claim the job (on its first batch, or
+    on success) gets to push its results. The other one gives up as soon as it finds out, and its last
+    event is ("hedge_lost", task_key, copy).
+    The job gets labelled with how long it took, and how many of its attempts got throttled (see job_result()).
+    Every attempt waits for its turn on the worker's RateLimiter, if any... unless the worker's ResponseCache
+    has the job cached: then its batches are read from disk, without issuing any request at all.
+    If the worker spools its results (see spool.py), every ("results", ...) event carries the descriptor of
+    a batch in the job's spool file, rather than the batch itself. A job whose spool file is already complete
+    (i.e.: it was fetched whole by the same run, before it got interrupted) just pushes its descriptors.
+    If the worker loads its results itself, every batch gets INSERTed right away, in a session (i.e.: a transaction)
+    of the job's own, and its ("results", ...) event only carries its n of results. The job gets committed before
+    its ("done", ...) event, labelled with what got loaded, or rolled back if it failed (or the database refused it).
+    Runs on a worker initialized with init_worker().
+    Args: customer_id: a client customer ID str.
+          query: the query, as defined in main().
+          retry_count: n of times the job has been retried already.
+          n_throttled: n of the job's previous attempts that got throttled.
+          copy: 0 for the job itself, 1 for its hedge.
+    """
+    task_key = (customer_id, query["name"], query["shard"], query["part"])
+    _events.put(("started", task_key, ((customer_id, query, retry_count, n_throttled), copy)))
+    n_batches, n_results = 0, 0
+    spool = SpoolWriter(spool_file(_spool_dir, task_key)) if _spool_dir else None
+    if spool and (descriptors := replay(spool.file)) is not None:
+        started = time.monotonic()
+        if not claim_job(task_key, copy):
+            _events.put(("hedge_lost", task_key, copy))
+            return
+        for descriptor in descriptors:
+            _events.put(("results", task_key, descriptor))
+        _events.put(("done", task_key, job_result(customer_id, query, sum(d[3] for d in descriptors), None,
+                                                  time.monotonic() - started, cached = True)))
+        return
+    batches = _cache.get(customer_id, query, _extraction) if _cache else None
+    cached = batches is not None
+    if not cached:
+        if _limiter:
+            _limiter.acquire(customer_id)
+        batches = iter_search_batches(_ga_service, customer_id, query, _extraction, _timeout)
+        if _cache:
+            batches = _cache.tee(batches, customer_id, query, _extraction)
+    started, latency = time.monotonic(), None
+    load, committed = None, None
+    try:
+        for results in batches:
+            if not n_batches and not claim_job(task_key, copy):
+                _events.put(("hedge_lost", task_key, copy))     # NOTE: drops the stream, cancelling the call
+                return
+            latency = latency or time.monotonic() - started
+            if _session_pool:
+                load = load or begin_load(_session_pool, customer_id, query, _replace and _replace[customer_id], _merge,
+                                          _direct)
+                load_batch(load, results, _batch_size)
+                _events.put(("results", task_key, len(results)))
+            else:
+                _events.put(("results", task_key, spool.write(results) if spool else results))
+            n_batches, n_results = n_batches + 1, n_results + len(results)
+        if not n_batches and not claim_job(task_key, copy):
+            _events.put(("hedge_lost", task_key, copy))
+            return
+        if spool:
+            spool.close()
+        if _session_pool:
+            if not load and _replace and _replace[customer_id]:     # No rows at all: what was loaded goes, still
+                load = begin_load(_session_pool, customer_id, query, _replace[customer_id], _merge, _direct)
+            committed, load = load, None
+            if committed and (refused := end_load(_session_pool, committed)):
+                res = job_result(customer_id, query, n_results, refused, time.monotonic() - started, latency, n_throttled)
+                _events.put(("done", task_key, res))
+                return
+        res = job_result(customer_id, query, n_results, None, time.monotonic() - started,
+                         None if cached else latency, n_throttled, cached, committed)
+
+    # NOTE: RESOURCE_EXHAUSTED and INTERNAL errors come as plain gRPC errors, not GoogleAdsExceptions
+    except (GoogleAdsException, grpc.RpcError) as ex:
+        # Only errors deemed retriable get retried, and only while there's retry budget left
+        if spool:
+            spool.abort()
+        error = describe_exception(ex)
+        n_throttled += is_throttled(error)
+        res = job_result(customer_id, query, n_results, ex, time.monotonic() - started, latency, n_throttled)
+        backoff = None if n_batches else _retry_policy.backoff(error, retry_count)
+        if backoff is not None:
+            _events.put(("retry", task_key, (backoff, (customer_id, query, retry_count + 1, n_throttled), res[1])))
+            return
+    finally:
+        if load:    # Discard partial results of a failed job
+            end_load(_session_pool, load, commit = False)
+    
+    _events.put(("done", task_key, res))
+
+def claim_job(task_key, copy):
+    """Claims a job for one of its copies. Jobs can only be claimed once, so the first copy to claim it
+    wins. Jobs are always up for grabs if hedging is off (see init_worker()).
+    Args: task_key: the job's task_key.
+          copy: the copy claiming the job.
+    Returns: True if the job is (now) claimed by copy.
+    """
+    return _claims is None or _claims.setdefault(task_key, copy) == copy
+
+def iter_search_batches(ga_service, customer_id, query, extraction = EXTRACTION_DEFAULT, timeout = SEARCH_TIMEOUT):
+    """Issues a search request using streaming, and yields every batch of results as it's received.
+    Returning a list of GoogleAdsRows would result in a PicklingError, so instead each batch is a list of
+    rows of bind values according to the query's dbschema (tuples, ready for .executemany()), extracted
+    right here, in the worker, so that extracting scales with the workers, rather than with the loader:
+     * extraction == 'dict': from GoogleAdsRow dicts, as returned by json_format.MessageToDict()
+     * extraction == 'proto': straight from the GoogleAdsRow messages. Skips MessageToDict() altogether.
+    Args: ga_service: a GoogleAdsService instance.
+          customer_id: a client customer ID str.
+          query: the query, as defined in main().
+          extraction: one of EXTRACTION_MODES.
+          timeout: deadline of the whole call, in secs. None for the client library's default.
+    """
+    kwargs = {"timeout": timeout} if timeout else {}
+    stream = ga_service.search_stream(customer_id = customer_id, query = query["query"], **kwargs)
+    extract_batch = batch_extractor(query, extraction)
+    for batch in stream:    # NOTE: every SearchGoogleAdsStreamResponse of the stream, not just the first
+        yield extract_batch(batch)
+
+def batch_extractor(query, extraction = EXTRACTION_DEFAULT):
+    """Returns a function that turns a SearchGoogleAdsStreamResponse into a list of rows, according
+    to extraction (see iter_search_batches()).
+    Args: query: the query, as defined in main().
+          extraction: one of EXTRACTION_MODES.
+    """
+    if extraction != 'proto':
+        extract = compile_extractor(query["dbschema"])  # see row_extractors.py
+        return lambda batch: [extract(json_format.MessageToDict(row)) for row in batch.results]
+    
+    extract = None
+    def extract_batch(batch):
+        nonlocal extract
+        if extract is None and batch.results:   # Compiled on the first row, see row_extractors.py
+            row = batch.results[0]
+            extract = compile_proto_extractor(query["dbschema"], getattr(row, '_pb', row).DESCRIPTOR)
+        return [extract(row) for row in batch.results]
+    return extract_batch
+
+def job_result(customer_id, query, n_results, ex = None, elapsed = None, latency = None, n_throttled = 0, cached = False,
+               load = None):
+    """Labels a finished job so it can be dealt with downstream.
+    Args: customer_id: the job's client customer ID str.
+          query: the job's query, as defined in main().
+          n_results: number of results pushed downstream.
+          ex: the exception that made the job fail, if it did.
+          elapsed: secs the job's last attempt took.
+          latency: secs from the start of the job's last attempt until its first batch of results, if any.
+          n_throttled: number of the job's attempts rejected for exceeding some quota (see throttling.py).
+          cached: whether its results were read from the response cache instead (see response_cache.py).
+          load: the load its results got committed with, if the worker loaded them itself (see begin_load()).
+    Returns: (True|False, job) tuple. NOTE: True indicates a successful query
+    """
+    job = {"customer_id": customer_id,
+           "query":       query,
+           "n_results":   n_results,
+           "elapsed":     elapsed,
+           "latency":     latency,
+           "n_throttled": n_throttled,
+           "cached":      cached,
+           "load":        {k: load[k] for k in ("n_inserted", "n_rejected", "n_deleted")} if load else None,}
+    if ex is None:
+        return (True, job)
+    job["error"] = describe_exception(ex)
+    return (False, job)
+
+def describe_exception(ex):
+    """Extracts what's relevant from a GoogleAdsException (or a plain gRPC error) into plain data. 
+    The exception itself holds on to its gRPC call, and can't be reliably pickled to be sent downstream.
+    Args: ex: a GoogleAdsException or a grpc.RpcError. Or a cx_Oracle.DatabaseError, for jobs the database
+              refused to commit (see end_load()).
+    Returns: a dict with the request_id, the gRPC status name, and every error's message, error
+             code (as "<error_type>.<ENUM_NAME>", e.g.: "quota_error.RESOURCE_EXHAUSTED") and fields.
+    """
+    if isinstance(ex, cx_Oracle.DatabaseError):
+        return {"request_id": None,
+                "status":     "DATABASE_ERROR",
+                "errors":     [{"message": str(ex), "error_code": None, "fields": []}],}
+    if not isinstance(ex, GoogleAdsException):  # e.g.: RESOURCE_EXHAUSTED, INTERNAL, UNAVAILABLE...
+        metadata = dict(ex.trailing_metadata() or ())
+        return {"request_id": metadata.get("request-id"),
+                "status":     ex.code().name,
+                "errors":     [{"message": ex.details(), "error_code": None, "fields": []}],}
+
+    errors = []
+    for error in ex.failure.errors:
+        error_code = getattr(error.error_code, "_pb", error.error_code)     # proto-plus wrapped, or not
+        error_type = error_code.WhichOneof("error_code")
+        if error_type:
+            enum_type = error_code.DESCRIPTOR.fields_by_name[error_type].enum_type
+            error_value = enum_type.values_by_number[getattr(error_code, error_type)].name
+            error_type = f"{error_type}.{error_value}"
+        fields = [e.field_name for e in error.location.field_path_elements] if error.location else []
+        errors.append({"message": error.message, "error_code": error_type, "fields": fields})
+    
+    return {"request_id": ex.request_id,
+            "status":     ex.error.code().name,
+            "errors":     errors,}
+
+def init_worker(events, settings = WorkerSettings()):
+    """Worker initializer: sets up the queue where each worker pushes its events downstream, how it
+    extracts them, and the GoogleAdsService it issues its requests through. A GoogleAdsService instance
+    cannot be serialized with pickle for parallel processing, but a GoogleAdsClient can be, so each
+    process gets the client and builds its own service, once. Threads share the globals, so for them 
+    this gets called just once.
+    Args: events: a multiprocessing.Queue (or a queue.Queue, for threads).
+          settings: a WorkerSettings namedtuple of (every one of them optional):
+              extraction: one of EXTRACTION_MODES. See iter_search_batches().
+              client: an initialized GoogleAdsClient instance.
+              limiter: a RateLimiter, shared by every worker.
+              retry_policy: a RetryPolicy, shared by every worker. Defaults to a RetryPolicy of its own.
+              timeout: deadline of every search_stream() call, in secs.
+              claims: a dict (a multiprocessing.Manager dict, for processes) shared by every worker where copies of
+                  hedged jobs claim them (see claim_job()). None if hedging is off.
+              cache: a ResponseCache, shared by every worker, if any.
+              spool_dir: the directory where workers spool their results to. None to push them through events.
+              loads_into: where workers load their results into themselves, rather than pushing them downstream
+                  (see issue_search_request()). For processes, the database (its key in DB_CONFIG_FILE): each one gets
+                  a session of its own. For threads, a cx_Oracle.SessionPool they all share. None to push them.
+              batch_size: max number of rows per .executemany() call, if workers load their results.
+              replace: the names of the campaigns whose rows loads replace, by customer_id (see begin_load()).
+              merge: whether loads get merged through a staging table (see begin_load()).
+              direct: whether loads get INSERTed direct-path (see begin_load()).
+    """
+    global _events, _extraction, _ga_service, _limiter, _retry_policy, _timeout, _claims, _cache, _spool_dir
+    global _session_pool, _batch_size, _replace, _merge, _direct
+    _events, _extraction, _limiter, _timeout = events, settings.extraction, settings.limiter, settings.timeout
+    _claims, _cache, _spool_dir, _batch_size = settings.claims, settings.cache, settings.spool_dir, settings.batch_size
+    _replace, _merge, _direct = settings.replace, settings.merge, settings.direct
+    loads_into = settings.loads_into
+    _session_pool = create_session_pool(loads_into, 1) if isinstance(loads_into, str) else loads_into
+    _retry_policy = settings.retry_policy or RetryPolicy()
+    _ga_service = settings.client.get_service("GoogleAdsService") if settings.client else None
+
+def stream_events(pool, func, inputs, events, max_pending = MAX_PENDING, controller = None,
+                  stall_timeout = STALL_TIMEOUT, hedge = False):
+    """Submits func(*input) to pool for each input, and yields the events the jobs push to events as 
+    soon as they arrive (see issue_search_request()). Jobs are submitted lazily: no more than 
+    max_pending jobs are ever running or queued, so that memory stays flat however many inputs there
+    are. A job is done once its ("done", ...) event has been yielded. Exceptions raised by func are 
+    re-raised here.
+    Jobs to be retried (i.e.: ("retry", task_key, (backoff, args, job)) events) wait in a queue of their
+    own, not taking up any worker, until their backoff is over. Then they're submitted ahead of new inputs.
+    Jobs in flight that go stall_timeout secs without pushing a batch get flagged as stalled.
+    Hedging: once every input has been submitted there are workers to spare, so jobs that have been running
+    for HEDGE_AFTER_FACTOR times the median job duration, and haven't pushed any results yet, get
+    a second copy submitted, slowest first. Whichever copy claims the job first wins (see claim_job()):
+    events of the other one are not yielded.
+    Args: pool: a concurrent.futures Executor whose workers were initialized with init_worker(events).
+          func: the function to call on each input.
+          inputs: an iterable of argument tuples for func.
+          events: the queue the jobs push their events to.
+          max_pending: max number of submitted jobs that aren't done.
+          controller: an AdaptiveConcurrency whose limit takes the place of max_pending, if any.
+          stall_timeout: secs without a batch after which a job gets flagged as stalled.
+          hedge: whether to hedge straggling jobs.
+    """
+    inputs = iter(inputs)
+    n_pending = 0
+    retries, sequence = [], count()     # Heap of (not before, n, args) of jobs to be retried
+    exhausted = False
+    running = {}        # Jobs in flight, by task_key
+    durations = []      # Of every finished job, for hedging
+    next_check = 0
+
+    def submit(args, copy = 0):
+        nonlocal n_pending
+        future = pool.submit(func, *args, copy = copy)
+        future.add_done_callback(lambda f: not f.cancelled() and f.exception() and events.put(("error", None, f.exception())))
+        n_pending += 1
+
+    def check_running(now):
+        """Flags stalled jobs, and hedges stragglers if there are workers to spare"""
+        for task_key, job in running.items():
+            if not job["stalled"] and now - job["last_batch"] > stall_timeout:
+                job["stalled"] = True
+                printerr(f"STALLED: no batches for {now - job['last_batch']:.0f}s // customer_id : {task_key[0]} "
+                         f"// query_name : {task_key[1]} // {task_label(job['args'][1])}")
+        n_spare = (controller.limit if controller else max_pending) - n_pending
+        if not hedge or not exhausted or retries or n_spare <= 0 or not durations:
+            return
+        hedge_after = HEDGE_AFTER_FACTOR * statistics.median(durations)
+        stragglers = [(task_key, job) for task_key, job in running.items()
+                      if not job["claimed"] and not job["hedged"] and now - job["started"] > hedge_after]
+        for task_key, job in sorted(stragglers, key = lambda item: item[1]["started"])[:n_spare]:
+            printout(f"HEDGING after {now - job['started']:.1f}s: customer_id : {task_key[0]} "
+                     f"// query_name : {task_key[1]} // {task_label(job['args'][1])}")
+            job["hedged"], job["n_copies"] = True, job["n_copies"] + 1
+            submit(job["args"], copy = 1)
+
+    while True:
+        # Submit as many jobs as allowed: retries due first, then new inputs
+        while n_pending < (controller.limit if controller else max_pending):
+            if retries and retries[0][0] <= time.monotonic():
+                submit(heapq.heappop(retries)[2])
+            elif not exhausted and (args := next(inputs, None)) is not None:
+                submit(args)
+            else:
+                exhausted = True
+                break
+        
+        if not n_pending:
+            if not retries:
+                return
+            time.sleep(max(0, retries[0][0] - time.monotonic()))   # Nothing else to do until the next retry
+            continue
+        try:     # Wait for an event... but not past the next retry, nor the next check of the jobs in flight
+            timeout = min(1, max(0, retries[0][0] - time.monotonic())) if retries else 1
+            event, task_key, payload = events.get(timeout = timeout)
+        except queue.Empty:
+            event = None
+        now = time.monotonic()
+        if now >= next_check:
+            check_running(now)
+            next_check = now + 1
+        if event is None:
+            continue
+        if event == "error":
+            raise payload
+        
+        job = running.get(task_key)
+        if event == "started":
+            args, copy = payload
+            if copy == 0:
+                running[task_key] = {"args": args, "started": now, "last_batch": now, "n_copies": 1,
+                                     "claimed": False, "hedged": False, "stalled": False}
+            continue
+        if event == "results":
+            job["claimed"], job["last_batch"], job["stalled"] = True, now, False
+            yield event, task_key, payload
+            continue
+
+        # event in ("done", "retry", "hedge_lost"): one copy of the job is over
+        n_pending -= 1
+        if event == "hedge_lost":
+            if job:
+                job["n_copies"] -= 1
+            continue
+        if controller:
+            controller.on_done(payload[-1])
+        if not job:     # A copy that lost to a job already done
+            continue
+        job["n_copies"] -= 1
+        # A copy failing before claiming the job doesn't fail the job, as long as its other copy is still on it
+        if not (event == "done" and payload[0]) and not job["claimed"] and job["n_copies"]:
+            continue
+        del running[task_key]
+        if event == "retry":
+            backoff, args, job = payload
+            printout(f'RETRYING in {backoff:.1f}s: customer_id : {job["customer_id"]} // '
+                     f'query_name : {job["query"]["name"]} // {task_label(job["query"])} // '
+                     f'status : {job["error"]["status"]}')
+            heapq.heappush(retries, (time.monotonic() + backoff, next(sequence), args))
+            continue
+        if payload[0] and not payload[1]["cached"]:
+            durations.append(payload[1]["elapsed"])
+        yield event, task_key, payload
+
+def drain_events(events):
+    """Discards every event pushed to events from now on, so that no job ever blocks pushing them"""
+    while True:
+        events.get()
+
+def stream_events_async(client, inputs, events, concurrency = ASYNC_CONCURRENCY, extraction = EXTRACTION_DEFAULT,
+                        controller = None, limiter = None, retry_policy = None, timeout = SEARCH_TIMEOUT, cache = None):
+    """The 'asyncio' engine: like stream_events(), but every job runs as a coroutine, all of them in
+    a background thread, sharing a single gRPC channel. Fetching is I/O bound, so up to concurrency
+    requests can be in flight at a time, way more than there could ever be processes in a pool.
+    Jobs push the very same events issue_search_request() does.
     Args: client: an initialized GoogleAdsClient instance.
+          inputs: an iterable of (customer_id, query) argument tuples.
+          events: a bounded queue.Queue the jobs push their events to.
+          concurrency: max number of jobs in flight.
+          extraction: one of EXTRACTION_MODES. See iter_search_batches().
+          controller: an AdaptiveConcurrency whose limit takes the place of concurrency, if any.
+          limiter: a RateLimiter every request waits its turn on, if any.
+          retry_policy: a RetryPolicy. Defaults to a RetryPolicy of its own.
+          timeout: deadline of every search_stream() call, in secs.
+          cache: a ResponseCache, if any.
+    """
+    retry_policy = retry_policy or RetryPolicy()
+    def run():
+        try:
+            asyncio.run(_fetch_all_async(client, inputs, events, concurrency, extraction, controller, limiter,
+                                         retry_policy, timeout, cache))
+            events.put(("end", None, None))
+        except BaseException as ex:
+            events.put(("error", None, ex))
+
+    threading.Thread(target = run, daemon = True).start()
+    while True:
+        event, task_key, payload = events.get()
+        if event == "error":
+            raise payload
+        if event == "end":
+            return
+        yield event, task_key, payload
+
+async def _fetch_all_async(client, inputs, events, concurrency, extraction, controller = None, limiter = None,
+                           retry_policy = None, timeout = SEARCH_TIMEOUT, cache = None):
+    """Runs every job as a coroutine, up to concurrency (or controller.limit) of them at a time. Coroutines
+    are created lazily, as slots free up, so that memory stays flat however many inputs there are.
+    If a job raises (i.e.: something went awfully wrong, as failed requests don't), every other job gets
+    cancelled, and the exception re-raised.
+    """
+    version = client.version or GOOGLE_ADS_API_VERSION
+    endpoint = client.endpoint or "googleads.googleapis.com"
+    options = GRPC_CHANNEL_OPTIONS + ([("grpc.http_proxy", client.http_proxy)] if client.http_proxy else [])
+    channel = grpc_helpers_async.create_channel(endpoint if ':' in endpoint else endpoint + ":443",
+                                                credentials = client.credentials, options = options)
+    types = import_module(f"google.ads.googleads.{version}.services.types.google_ads_service")
+    request_type = types.SearchGoogleAdsStreamRequest.pb()
+    response_type = types.SearchGoogleAdsStreamResponse.pb()
+    search_stream = channel.unary_stream(f"/google.ads.googleads.{version}.services.GoogleAdsService/SearchStream",
+                                         request_serializer = request_type.SerializeToString,
+                                         response_deserializer = response_type.FromString)
+    metadata = [("developer-token", client.developer_token)]
+    if client.login_customer_id:
+        metadata.append(("login-customer-id", str(client.login_customer_id)))
+    if client.linked_customer_id:
+        metadata.append(("linked-customer-id", str(client.linked_customer_id)))
+
+    async def search(customer_id, query):
+        """Issues a search request using streaming, yielding every SearchGoogleAdsStreamResponse"""
+        call = search_stream(request_type(customer_id = customer_id, query = query), metadata = metadata,
+                             timeout = timeout)
+        try:
+            async for batch in call:
+                yield batch
+        except grpc.aio.AioRpcError as ex:
+            raise _as_google_ads_exception(ex, version)
+
+    jobs = set()
+    slot_freed = asyncio.Event()
+    failed = []     # The exception of the job that went awfully wrong, if any
+
+    def on_done(job):
+        jobs.discard(job)
+        slot_freed.set()
+        if job.cancelled():
+            return
+        if job.exception():     # Just like the 'pool' engine: nothing else gets run (see stream_events())
+            if not failed:
+                failed.append(job.exception())
+            for other in jobs:
+                other.cancel()
+        elif controller:
+            controller.on_done(job.result()[1])
+
+    async with channel:
+        for customer_id, query in inputs:
+            while len(jobs) >= (controller.limit if controller else concurrency) and not failed:
+                slot_freed.clear()
+                await slot_freed.wait()
+            if failed:
+                break
+            job = asyncio.create_task(_issue_search_request_async(search, customer_id, query, events, extraction,
+                                                                  limiter, retry_policy, cache))
+            jobs.add(job)
+            job.add_done_callback(on_done)
+        await asyncio.gather(*jobs, return_exceptions = True)
+    if failed:      # Pushed downstream as an ("error", None, exception) event (see stream_events_async())
+        raise failed[0]
+
+async def _issue_search_request_async(search, customer_id, query, events, extraction, limiter = None,
+                                      retry_policy = None, cache = None):
+    """Coroutine version of issue_search_request(), with the very same retry policy and events, but for
+    ("retry", ...) events: a coroutine sleeping through its backoff doesn't hold up any worker, so it
+    just retries by itself.
+    Returns: the job's (True|False, job) tuple, as pushed with its ("done", ...) event.
+    Args: search: an async generator function of (customer_id, query str) yielding SearchGoogleAdsStreamResponses.
           customer_id: a client customer ID str.
-          query: a GAQL query str.
+          query: the query, as defined in main().
+          events: a bounded queue.Queue to push events to.
+          extraction: one of EXTRACTION_MODES.
+          limiter: a RateLimiter, if any.
+          retry_policy: a RetryPolicy.
+          cache: a ResponseCache, if any.
     """
-    ga_service = client.get_service("GoogleAdsService")
-    retry_count = 0
-    # Retry until we've reached MAX_RETRIES or have successfully received a
-    # response.
+    task_key = (customer_id, query["name"], query["shard"], query["part"])
+    retry_count, n_throttled = 0, 0
+    n_batches, n_results = 0, 0
+    started = time.monotonic()
+    cached = cache.get(customer_id, query, extraction) if cache else None
+    while cached is not None:   # Read from disk in a thread of its own, so as not to block the loop
+        results = await asyncio.to_thread(next, cached, None)
+        if results is None:
+            res = job_result(customer_id, query, n_results, None, time.monotonic() - started, cached = True)
+            await asyncio.to_thread(events.put, ("done", task_key, res))
+            return res
+        await asyncio.to_thread(events.put, ("results", task_key, results))
+        n_batches, n_results = n_batches + 1, n_results + len(results)
     while True:
+        if limiter:
+            await limiter.acquire_async(customer_id)
+        attempt_started, latency = time.monotonic(), None
+        writer = cache.writer(customer_id, query, extraction) if cache else None
         try:
-            stream = ga_service.search_stream(customer_id = customer_id, query = query["query"])
-
-            # Returning a list of GoogleAdsRows will result in a PicklingError, so instead 
-            # we put the GoogleAdsRow data into a list of str results and return that.
-            results_dicts = []
-            for batch in stream:
-                for row in batch.results:
-                    results_dicts.append(json_format.MessageToDict(row))
-                # NOTE: True indicates a successful query
-                return (True, {"customer_id": customer_id,     # NOTE: Label it so it can be 
-                               "query":       query,           #    dealt with when returned
-                               "results":     results_dicts,})
-
-        except GoogleAdsException as ex:
-            # This example retries on all GoogleAdsExceptions. In practice, developers 
-            # might want to limit retries to only those error codes they deem retriable.
-            if retry_count < MAX_RETRIES:
+            extract_batch = batch_extractor(query, extraction)
+            async for batch in search(customer_id, query["query"]):
+                latency = latency or time.monotonic() - attempt_started
+                results = extract_batch(batch)
+                if writer:
+                    writer.write(results)
+                await asyncio.to_thread(events.put, ("results", task_key, results))   # Don't block the loop
+                n_batches, n_results = n_batches + 1, n_results + len(results)
+            if writer:
+                writer.commit()
+            res = job_result(customer_id, query, n_results, None, time.monotonic() - started, latency, n_throttled)
+            break
+
+        except (GoogleAdsException, grpc.RpcError) as ex:
+            if writer:
+                writer.discard()
+            error = describe_exception(ex)
+            n_throttled += is_throttled(error)
+            backoff = None if n_batches else retry_policy.backoff(error, retry_count)
+            if backoff is not None:
                 retry_count += 1
-                time.sleep(retry_count * BACKOFF_FACTOR)
+                await asyncio.sleep(backoff)
             else:
-                # NOTE: False indicates a failed query, after MAX_RETRIES attempts
-                return (False, {"customer_id": customer_id,    # NOTE: Label it so it can be 
-                                "query":       query,          #    dealt with when returned
-                                "exception":   ex,})
-
-def generate_inputs(client, customer_ids, queries):
-    """Generates all inputs to feed into search requests.
-    A GoogleAdsService instance cannot be serialized with pickle for
-    parallel processing, but a GoogleAdsClient can be, so we pass the 
-    client to the pool task which will then get the GoogleAdsService 
-    instance.
-    Args: client: An initialized GoogleAdsClient instance.
-          customer_ids: A list of str client customer IDs.
-          queries: A list of str GAQL queries.
+                res = job_result(customer_id, query, n_results, ex, time.monotonic() - started, latency, n_throttled)
+                break
+    
+    await asyncio.to_thread(events.put, ("done", task_key, res))
+    return res
+
+def _as_google_ads_exception(ex, version):
+    """Wraps a gRPC error as a GoogleAdsException if its trailing metadata has a GoogleAdsFailure,
+    the same way the GoogleAdsClient's services do. Otherwise returns it as it is.
     """
-    return product([client], customer_ids, queries)
+    failure_key = f"google.ads.googleads.{version}.errors.googleadsfailure-bin"
+    metadata = dict(ex.trailing_metadata() or ())
+    if failure_key not in metadata:
+        return ex
+    errors = import_module(f"google.ads.googleads.{version}.errors.types.errors")
+    failure = errors.GoogleAdsFailure.deserialize(metadata[failure_key])
+    return GoogleAdsException(ex, ex, failure, metadata.get("request-id"))
 
-def as_camelcase(string):
+def shard_dates(date_range, shard_days = None):
+    """Splits a date range into consecutive shards of up to shard_days days each.
+    Args: date_range: a DateRange namedtuple of dates.
+          shard_days: max n of days per shard. None for a single shard, spanning the whole date range.
+    Returns: a list of (start, end) tuples of dates, both inclusive.
     """
-    Convert a string from snake_case to camelCase
-    Args: string: A string to be converted from snake_case to camelCase
-                                                              by Ленина
+    if not shard_days:
+        return [(date_range.start, date_range.end)]
+    shards, start = [], date_range.start
+    while start <= date_range.end:
+        end = min(start + timedelta(days = shard_days - 1), date_range.end)
+        shards.append((start, end))
+        start = end + timedelta(days = 1)
+    return shards
+
+def shard_queries(queries, shards):
+    """Generates a copy of every query for every shard, with its GAQL date range string filled in, and
+    labelled with its "shard": an ISO formatted (start, end) tuple.
+    Args: queries: query templates, as defined in main().
+          shards: a list of (start, end) tuples of dates, as returned by shard_dates().
     """
-    substrings = string.split('_')
-    if substrings[1:]:
-        substrings[1:] = [s.capitalize() for s in substrings[1:]]
-    
-    return ''.join(substrings)
-
-def get_field(mapping, field):
-    """
-    Treewalks a given dictionary's keys in order to access a nested
-    field. If such field does not exist, it returns 'None'.
-    NOTE: if field == None, then it defaults to returning None. While
-          this is a kruft added to deal with an outdated database, on
-          the other hand it seems like a 'sane' behaviour all by itself
-    Args: mapping: A dictionary, maybe having dictionaries for values
-          field: A point-separated ('.') separated string that
-              specifies a key potentially buried within nested dicts
-              It expects each point-delimited substring as snake-case,
-              and converts them into camelCase prior to using them to
-              treewalk mapping.
-                                                              by Ленина
+    for query in queries:
+        for start, end in shards:
+            yield dict(query, query = query["query"].format(date_range = date_range_condition(start, end),
+                                                            campaigns = '{campaigns}'),     # Left for generate_inputs()
+                       shard = (start.isoformat(), end.isoformat()))
+
+def date_range_condition(start, end):
+    """Returns: the GAQL condition on segments.date for the dates from start to end, both inclusive"""
+    return ( "DURING TODAY" if (start == end == date.today()) 
+        else f"BETWEEN '{start.isoformat()}' AND '{end.isoformat()}'" )
+
+def incremental_date_range(date_range, loaded_through = None, restatement_days = RESTATEMENT_DAYS):
+    """Returns: the part of date_range an incremental job has to fetch: every day after the last one fully
+    loaded (or the whole of date_range, if none has been yet), along with the last restatement_days days of
+    date_range, loaded or not. None if there's nothing to fetch.
+    Args: date_range: a DateRange namedtuple of dates.
+          loaded_through: the last date fully loaded, as recorded in the state store.
+          restatement_days: n of trailing days to fetch again.
     """
-    if not field:   # FIXME: Exists to deal with None's in the schema, that themselves exist
-        return None # in order to deal with an outdated (and to be fixed), database schema
+    if loaded_through is None:
+        return date_range
+    start = min(loaded_through + timedelta(days = 1), date_range.end - timedelta(days = restatement_days - 1))
+    return date_range._replace(start = start) if start <= date_range.end else None
 
-    attrs = field.split('.')
-    attrs = [as_camelcase(attr) for attr in attrs]
-    attrs.reverse() # reverse in place so as to be treated as a stack
+def update_watermarks(store, database, campaign_status, date_ranges, first_failed):
+    """Records, for every (customer_id, query name) of an incremental run, the last date fully loaded.
+    Moves forward up to the end of its date range (yesterday at most: today isn't over yet) if every shard
+    got loaded. Otherwise moves back, if need be, to the day before the first failed shard, so that whatever
+    comes after it gets fetched again next time. Never set to a date before the range fetched, though (e.g.: a
+    first run of just today): nothing before it got loaded.
+    Args: store: a StateStore.
+          database: the database everything got loaded into.
+          campaign_status: the status of the campaigns everything got loaded of.
+          date_ranges: DateRanges fetched, by (customer_id, query name).
+          first_failed: start (YYYY-MM-DD) of the first failed shard, by (customer_id, query name).
+    """
+    yesterday = date.today() - timedelta(days = 1)
+    for (customer_id, query_name), job_range in date_ranges.items():
+        old = store.watermark(database, customer_id, query_name, campaign_status)
+        if (customer_id, query_name) in first_failed:
+            new = date.fromisoformat(first_failed[customer_id, query_name]) - timedelta(days = 1)
+            new = min(new, old) if old else new
+        else:
+            new = min(job_range.end, yesterday)
+            new = max(new, old) if old else new
+        if not old and new < job_range.start:   # Nothing loaded through any day yet
+            continue
+        if new != old:
+            store.set_watermark(database, customer_id, query_name, campaign_status, new)
+            printout(f"WATERMARK: customer_id : {customer_id} // query_name : {query_name} "
+                     f"// loaded through : {old} -> {new}")
 
-    if attrs:                           # XXX: is this redundant? ... i think it is...
-        pivot = mapping[attrs.pop()]
-    else:
-        return None
-  
-    while attrs:
-        try:
-            pivot = pivot[attrs.pop()]
-        except KeyError:    # the Google Ads API returned a non-existent field ... assume that field is empty
-            return None     # it signals an empty field
-        except Exception as ex:
-            printerr("SOMETHING WENT AWFULY WRONG!!!")
-            printerr("+++ DEBUG INFO: ")
-            printerr('\t', ex)
-            raise     
+def shard_length(shard):
+    """Returns: n of days of a query's ISO formatted (start, end) shard"""
+    return (date.fromisoformat(shard[1]) - date.fromisoformat(shard[0])).days + 1
+
+def generate_inputs(jobs, store = None, campaigns = None, split_rows = None):
+    """Generates all inputs to feed into search requests. If there's a state store, they're sorted biggest
+    job first (i.e.: longest predicted duration first), jobs never seen before going first of all.
+    Jobs of customers in campaigns predicted to be bigger than split_rows rows get split in parts of around
+    split_rows rows, each one querying a share of the customer's campaigns (by campaign.id IN (...)). 
+    Every job's query is labelled with its "part": an (i, n) tuple, i from 1 to n.
+    Args: jobs: A list of (customer_id, query) tuples, queries as defined in main(), with their {campaigns}
+              left to be filled in.
+          store: a StateStore, if any.
+          campaigns: lists of campaign IDs, by customer_id, as returned by fetch_campaigns(). None to just assume
+              there are campaigns enough to split jobs in as many parts as they need, e.g.: to plan (see print_plan())
+              without fetching anything. Parts get no campaign.id condition at all then: they're not meant to be run.
+          split_rows: max n of rows per part.
+    """
+    inputs = []
+    for customer_id, query in jobs:
+        n_parts = 1
+        if split_rows and store and (campaigns is None or customer_id in campaigns):
+            n_parts = math.ceil(predicted_rows(store, customer_id, query) / split_rows)
+            if campaigns is not None:
+                n_parts = min(len(campaigns[customer_id]), n_parts)
+            n_parts = max(1, n_parts)
+        for i in range(n_parts):
+            # Campaigns get dealt round-robin. Every campaign falls in exactly one part, so that all parts
+            # together get exactly the same rows the whole query would
+            condition = f" AND campaign.id IN ({', '.join(map(str, campaigns[customer_id][i::n_parts]))})" \
+                        if n_parts > 1 and campaigns is not None else ''
+            inputs.append((customer_id, dict(query, query = query["query"].format(campaigns = condition),
+                                                    part = (i + 1, n_parts))))
+    if store is None:
+        return inputs
+    return sorted(inputs, key = lambda args: -predicted_duration(store, *args))
+
+def fetch_campaigns(client, customer_ids, campaign_status, field = "id"):
+    """Fetches a field (the ID, or the name) of every campaign of every customer with the given status (a cheap
+    query), e.g.: to split their jobs by campaign (see generate_inputs()).
+    Args: client: an initialized GoogleAdsClient instance.
+          customer_ids: A list of str client customer IDs.
+          campaign_status: one of CAMPAIGN_VALID_STATUSES.
+          field: the campaign's field, e.g.: "id" or "name".
+    Returns: a dict of sorted lists of the campaigns' field, by customer_id.
+    """
+    if not customer_ids:
+        return {}
+    ga_service = client.get_service("GoogleAdsService")
+    query = f"SELECT campaign.{field} FROM campaign WHERE campaign.status = {campaign_status} ORDER BY campaign.{field}"
+    campaigns = {}
+    for customer_id in customer_ids:
+        stream = ga_service.search_stream(customer_id = customer_id, query = query)
+        campaigns[customer_id] = [getattr(row.campaign, field) for batch in stream for row in batch.results]
+        printout(f"CAMPAIGNS: customer_id : {customer_id} // {len(campaigns[customer_id])} campaigns with status "
+                 f"{campaign_status}")
+    return campaigns
+
+def predicted_rows(store, customer_id, query):
+    """Returns: a job's predicted n of rows (as a whole, not split), according to store. 0 if it's never been seen"""
+    prediction = store.predict(customer_id, query["name"], shard_length(query["shard"]))
+    return prediction[0] if prediction else 0
+
+def task_label(query):
+    """Returns: a label of a job's query shard and part, for the run log"""
+    start, end = query["shard"]
+    i, n = query.get("part", (1, 1))
+    return f'dates : {start}..{end}' + (f' // campaigns : {i}/{n}' if n > 1 else '')
+
+def predicted_duration(store, customer_id, query):
+    """Returns: a job's predicted duration in secs, according to store. Infinite if it's never been seen"""
+    prediction = store.predict(customer_id, query["name"], shard_length(query["shard"]))
+    return prediction[1] / query["part"][1] if prediction else float('inf')
+
+def print_plan(inputs, store, n_workers):
+    """Prints the predicted schedule of inputs: each job, in order, goes to the first of n_workers to be
+    free, and takes as long as store predicts. Jobs never seen before are assumed to take as long as the
+    median job.
+    Args: inputs: the inputs, as generated by generate_inputs().
+          store: a StateStore.
+          n_workers: n of jobs run at a time.
+    """
+    durations = [(customer_id, query, predicted_duration(store, customer_id, query)) for customer_id, query in inputs]
+    known = [d for _, _, d in durations if d != float('inf')]
+    median = statistics.median(known) if known else 0
     
-    return pivot
+    workers = [(0, worker) for worker in range(n_workers)]     # Heap of (free at, worker)
+    printout(f"PLAN: {len(durations)} jobs on {n_workers} workers")
+    for customer_id, query, duration in durations:
+        start, worker = heapq.heappop(workers)
+        guess = duration == float('inf')
+        end = start + (median if guess else duration)
+        heapq.heappush(workers, (end, worker))
+        printout(f'\tworker : {worker:3} // {start:8.1f}s -> {end:8.1f}s // customer_id : {customer_id} '
+                 f'// query_name : {query["name"]} // {task_label(query)}' + (' // (never seen, median guessed)' if guess else ''))
+    printout(f"Predicted makespan: {max(end for end, _ in workers):.1f}s")
 
 def printout(*args, **kwargs):
     """
@@ -380,7 +1586,7 @@ def printerr(*args, **kwargs):
 # @entrypoint
 if __name__ == "__main__":
     # GoogleAdsClient will read the google-ads.yaml configuration file in the home directory if none is specified.
-    googleads_client = GoogleAdsClient.load_from_storage(version="v11", path='.\google-ads.yaml')
+    googleads_client = GoogleAdsClient.load_from_storage(version=GOOGLE_ADS_API_VERSION, path='.\google-ads.yaml')
 
     parser = argparse.ArgumentParser(description = "Download a set of reports in parallel from a list of accounts.")
     
@@ -420,12 +1626,179 @@ if __name__ == "__main__":
                         help = "Specifies to which database to commit. Database names with spaces must be quoted. " + 
                                "Values specified in " + DB_CONFIG_FILE + '. ' "Available database options: " + 
                                ', '.join(available_dbs))
+    parser.add_argument("-b", "--batch_size",
+                        type = int, default = ORACLE_BATCH_SIZE,
+                        help = "Number of rows per INSERT round trip to the database (array DML). "
+                               f"Defaults to: {ORACLE_BATCH_SIZE}")
+    parser.add_argument("--loaders",
+                        type = int, default = LOADERS,
+                        help = "Number of threads loading results into the database concurrently, each request in a "
+                               f"session (i.e.: a transaction) of its own. Defaults to: {LOADERS}")
+    parser.add_argument("--load_in_workers", "--load-in-workers",
+                        action = "store_true",
+                        help = "Workers load (and commit) their own results, each one in a session of its own, and only "
+                               "pass along how many got loaded, instead of the loaders ('pool' engine only, not along "
+                               "with --spool)")
+    parser.add_argument("--merge",
+                        action = "store_true",
+                        help = "INSERT results into a staging table (<table>" + STAGING_SUFFIX + ", created if missing), and "
+                               "MERGE them into their table on its natural key (customer, date, device, campaign, "
+                               "ad group, keyword or ad), so that loading them again updates them instead of "
+                               "duplicating them")
+    parser.add_argument("--direct",
+                        action = "store_true",
+                        help = "INSERT every request's results direct-path (/*+ APPEND_VALUES */), all at once right "
+                               "before committing: no undo (nor redo, for NOLOGGING tables), but the whole request "
+                               "is held in memory, and loads into the same table take turns. Meant for big "
+                               "backfills. Needs --shard_days, to keep requests small enough")
+    parser.add_argument("-p", "--max_pending",
+                        type = int, default = None,
+                        help = "Max number of requests in flight (and of batches of results queued to be loaded to "
+                               f"the database). Bounds memory usage. Defaults to: {MAX_PENDING} "
+                               f"({2 * MAX_THREADS} for the 'thread' executor)")
+    parser.add_argument("-x", "--extraction",
+                        type = str, default = EXTRACTION_DEFAULT, choices = EXTRACTION_MODES,
+                        help = "How rows are extracted from Google Ads results, in the workers. 'dict': through "
+                               "MessageToDict(). 'proto': straight from the protobuf messages (faster). "
+                               f"Defaults to: {EXTRACTION_DEFAULT}")
+    parser.add_argument("-g", "--engine",
+                        type = str, default = ENGINE_DEFAULT, choices = ENGINES,
+                        help = "How requests are run. 'pool': on a pool of processes. 'asyncio': as coroutines over "
+                               f"a single connection, up to CONCURRENCY at a time. Defaults to: {ENGINE_DEFAULT}")
+    parser.add_argument("--executor",
+                        type = str, default = EXECUTOR_DEFAULT, choices = EXECUTORS,
+                        help = f"How the 'pool' engine runs requests. 'process': on {MAX_PROCESSES} processes. "
+                               f"'thread': on {MAX_THREADS} threads sharing a single connection. "
+                               f"Defaults to: {EXECUTOR_DEFAULT}")
+    parser.add_argument("--concurrency",
+                        type = int, default = ASYNC_CONCURRENCY,
+                        help = "Max number of requests in flight for the 'asyncio' engine. NOTE: each request in "
+                               f"flight may hold a database session. Defaults to: {ASYNC_CONCURRENCY}")
+    parser.add_argument("-a", "--adaptive",
+                        action = "store_true",
+                        help = "Adapt the number of requests in flight at runtime: back off sharply on quota errors, "
+                               "and slowly ramp up (up to MAX_PENDING, or CONCURRENCY) while latency stays healthy. "
+                               "Every change gets logged along with its reason")
+    parser.add_argument("--min_concurrency",
+                        type = int, default = 1,
+                        help = "Min number of requests in flight for --adaptive. Defaults to: 1")
+    parser.add_argument("-r", "--rps",
+                        type = float, default = None,
+                        help = "Max requests per second, across every worker. Defaults to: no limit")
+    parser.add_argument("--burst",
+                        type = int, default = None,
+                        help = "Max requests issued at once, after some idle time. Defaults to: RPS")
+    parser.add_argument("--customer_rps",
+                        type = float, default = None,
+                        help = "Max requests per second for each customer on its own. Defaults to: no limit")
+    parser.add_argument("--customer_burst",
+                        type = int, default = None,
+                        help = "Same as --burst, for each customer on its own. Defaults to: CUSTOMER_RPS")
+    # ... regarding how failed requests get retried (see retry_policy.py)
+    parser.add_argument("--max_retries",
+                        type = int, default = MAX_RETRIES,
+                        help = f"Max number of retries per request. Only transient and quota errors get retried. "
+                               f"Defaults to: {MAX_RETRIES}")
+    parser.add_argument("--backoff_base",
+                        type = float, default = BACKOFF_BASE,
+                        help = "Backoff before the first retry, in seconds. Doubles on every retry (with full "
+                               f"jitter), and it's longer for quota errors. Defaults to: {BACKOFF_BASE}")
+    parser.add_argument("--backoff_cap",
+                        type = float, default = BACKOFF_CAP,
+                        help = f"Max backoff before a retry, in seconds. Defaults to: {BACKOFF_CAP}")
+    parser.add_argument("--retry_budget",
+                        type = int, default = None,
+                        help = "Max number of retries in total, for the whole run. "
+                               f"Defaults to: {RETRY_BUDGET_RATIO:.0%} of the requests")
+    # ... regarding slow requests
+    parser.add_argument("-t", "--timeout",
+                        type = float, default = SEARCH_TIMEOUT,
+                        help = "Deadline of every request, in seconds. Requests past their deadline fail with "
+                               "DEADLINE_EXCEEDED (and get retried). Defaults to: the client library's default")
+    parser.add_argument("--stall_timeout",
+                        type = float, default = STALL_TIMEOUT,
+                        help = "Seconds without receiving a batch after which a request gets flagged as stalled "
+                               f"('pool' engine only). Defaults to: {STALL_TIMEOUT}")
+    parser.add_argument("--hedge",
+                        action = "store_true",
+                        help = "Once every request has been issued, re-issue the slowest ones still waiting for "
+                               f"their first batch after {HEDGE_AFTER_FACTOR}x the median request time, and keep "
+                               "whichever copy answers first ('pool' engine only)")
+    # ... regarding what's remembered from previous runs (see state_store.py)
+    parser.add_argument("--state_db",
+                        type = str, default = STATE_DB_FILE,
+                        help = "SQLite file where the stats of every request get recorded, to schedule the biggest "
+                               f"ones first on the next runs. Defaults to: {STATE_DB_FILE}")
+    parser.add_argument("--plan",
+                        action = "store_true",
+                        help = "Just print the predicted schedule, biggest requests first, and exit")
+    # ... regarding long date ranges
+    parser.add_argument("--shard_days",
+                        type = int, default = None,
+                        help = "Split the date range into shards of up to SHARD_DAYS days, each one requested, loaded "
+                               "and committed on its own (e.g.: 1 for a shard per day). Defaults to: a single shard")
+    parser.add_argument("--split_rows",
+                        type = int, default = None,
+                        help = "Split requests predicted (by previous runs) to return more than SPLIT_ROWS rows into "
+                               "parts of around SPLIT_ROWS rows, each one on a share of the account's campaigns. "
+                               "Defaults to: never split them")
+    # ... regarding scheduled runs
+    parser.add_argument("-i", "--incremental",
+                        action = "store_true",
+                        help = "Fetch only the days after the last one fully loaded into the database by previous "
+                               "runs of the same CAMPAIGN_STATUS (START_DATE onwards, the first time), plus the last "
+                               "RESTATEMENT_DAYS days, which replace whatever was loaded of them of the campaigns with "
+                               "CAMPAIGN_STATUS now")
+    parser.add_argument("--restatement_days",
+                        type = int, default = RESTATEMENT_DAYS,
+                        help = "Trailing days up to END_DATE that --incremental runs fetch again, as conversions "
+                               f"keep getting restated. Defaults to: {RESTATEMENT_DAYS}")
+    # ... regarding what's cached from previous runs (see response_cache.py)
+    parser.add_argument("--no_cache", "--no-cache",
+                        action = "store_true",
+                        help = "Don't read nor write the response cache: fetch everything from Google Ads")
+    parser.add_argument("--cache_dir",
+                        type = str, default = CACHE_DIR,
+                        help = "Directory where requests for final dates get cached, so that reloading them (e.g.: into "
+                               f"another database) doesn't fetch them again. Defaults to: {CACHE_DIR}")
+    parser.add_argument("--cache_max_mb",
+                        type = int, default = CACHE_MAX_BYTES // 1024 ** 2,
+                        help = "Max size of the response cache, in MB. Past it, the least recently used requests get "
+                               f"evicted at the end of the run. Defaults to: {CACHE_MAX_BYTES // 1024 ** 2}")
+    parser.add_argument("--cache_final_days",
+                        type = int, default = CACHE_FINAL_DAYS,
+                        help = "Only requests for dates at least CACHE_FINAL_DAYS days ago (considered final, i.e.: "
+                               f"not to be restated anymore) get cached. Defaults to: {CACHE_FINAL_DAYS}")
+    # ... regarding interrupted runs (see run_manifest.py)
+    parser.add_argument("--runs_keep_days",
+                        type = int, default = RUNS_KEEP_DAYS,
+                        help = f"Days the directories of runs done (every request committed) are kept for in {RUNS_DIR} "
+                               "after they last ran. Runs with requests left to resume or re-run are kept however old: "
+                               f"remove those by hand once dealt with. Defaults to: {RUNS_KEEP_DAYS}")
+    parser.add_argument("--resume",
+                        type = str, default = None, metavar = "RUN_ID",
+                        help = "Resume the run RUN_ID (as logged when it started): run only its requests for these "
+                               "customer IDs that failed or didn't get committed, as they were planned, ignoring the "
+                               f"date range and the like. Its manifest is at {RUNS_DIR}/RUN_ID/{MANIFEST_FILE}")
+    parser.add_argument("--rerun_failures", "--rerun-failures",
+                        type = str, default = None, metavar = "FILE",
+                        help = "Run, as a new run, only the failed requests for these customer IDs listed in FILE, as "
+                               f"written at the end of a run with failures ({RUNS_DIR}/RUN_ID/{FAILURES_FILE}), "
+                               "ignoring the date range and the like")
+    parser.add_argument("--spool",
+                        action = "store_true",
+                        help = "Workers write their results to compressed spool files in the run's directory, and only "
+                               "pass along where to read them from. Spool files of requests that got fetched whole get "
+                               "loaded again, without fetching them again, by --resume ('pool' engine only)")
     
     args = parser.parse_args()
 
     # Override the login_customer_id on the GoogleAdsClient, if specified.
     if args.login_customer_id is not None:
         googleads_client.login_customer_id = args.login_customer_id
+    # Raw protobuf messages are cheaper to read than proto-plus wrapped ones
+    if args.extraction == 'proto':
+        googleads_client.use_proto_plus = False
 
     # Compute and validate date range from cmd_line parameters:
     # ... it's necessary to validate if dates is specified in cmdline. XXX: there's probably a better way to write this...
@@ -458,5 +1831,85 @@ if __name__ == "__main__":
         printerr("Database not available.")
         printerr("Available Databases:", ', '.join(available_dbs))
         exit(1)
+    elif args.batch_size < 1:
+        printerr("Value for batch_size has to be a positive integer.")
+        exit(1)
+    elif args.loaders < 1:
+        printerr("Value for loaders has to be a positive integer.")
+        exit(1)
+    elif args.max_pending is not None and args.max_pending < 1:
+        printerr("Value for max_pending has to be a positive integer.")
+        exit(1)
+    elif args.concurrency < 1:
+        printerr("Value for concurrency has to be a positive integer.")
+        exit(1)
+    elif args.min_concurrency < 1:
+        printerr("Value for min_concurrency has to be a positive integer.")
+        exit(1)
+    elif any(v is not None and v <= 0 for v in (args.rps, args.burst, args.customer_rps, args.customer_burst)):
+        printerr("Values for rps, burst, customer_rps and customer_burst have to be positive.")
+        exit(1)
+    elif args.max_retries < 0 or (args.retry_budget is not None and args.retry_budget < 0):
+        printerr("Values for max_retries and retry_budget can't be negative.")
+        exit(1)
+    elif args.backoff_base < 0 or args.backoff_cap < 0:
+        printerr("Values for backoff_base and backoff_cap can't be negative.")
+        exit(1)
+    elif (args.timeout is not None and args.timeout <= 0) or args.stall_timeout <= 0:
+        printerr("Values for timeout and stall_timeout have to be positive.")
+        exit(1)
+    elif args.shard_days is not None and args.shard_days < 1:
+        printerr("Value for shard_days has to be a positive integer.")
+        exit(1)
+    elif args.split_rows is not None and args.split_rows < 1:
+        printerr("Value for split_rows has to be a positive integer.")
+        exit(1)
+    elif args.restatement_days < 0:
+        printerr("Value for restatement_days can't be negative.")
+        exit(1)
+    elif args.cache_max_mb < 0 or args.cache_final_days < 0 or args.runs_keep_days < 0:
+        printerr("Values for cache_max_mb, cache_final_days and runs_keep_days can't be negative.")
+        exit(1)
+    elif args.resume and not os.path.exists(os.path.join(RUNS_DIR, args.resume, MANIFEST_FILE)):
+        printerr(f"No run to resume with RUN_ID {args.resume} in {RUNS_DIR}.")
+        exit(1)
+    elif args.rerun_failures and not os.path.exists(args.rerun_failures):
+        printerr(f"Failures file {args.rerun_failures} not found.")
+        exit(1)
+    elif args.resume and args.rerun_failures:
+        printerr("Options resume and rerun_failures can't be used together.")
+        exit(1)
+    elif args.engine == 'asyncio' and (args.load_in_workers or args.hedge or args.spool
+                                       or args.stall_timeout != STALL_TIMEOUT):
+        printerr("Options load_in_workers, hedge, spool and stall_timeout need the 'pool' engine.")
+        exit(1)
+    elif args.load_in_workers and args.spool:   # Results that never leave the workers have nothing to spool
+        printerr("Options load_in_workers and spool can't be used together.")
+        exit(1)
+    elif args.direct and args.merge:    # The MERGE couldn't read the staging table until committed (ORA-12838)
+        printerr("Options direct and merge can't be used together.")
+        exit(1)
+    elif args.direct and args.shard_days is None:   # Every row of a request is held in memory until it's INSERTed
+        printerr("Option direct needs shard_days, to keep requests small enough to be held in memory.")
+        exit(1)
+    elif args.direct and args.incremental:  # Loads waiting on each other's DELETE and INSERT deadlock (ORA-00060)
+        printerr("Options direct and incremental can't be used together.")
+        exit(1)
+    elif args.incremental and args.split_rows is not None:   # Rows can't be told apart by campaign.id to be replaced
+        printerr("Options incremental and split_rows can't be used together.")
+        exit(1)
     else:
-        main(googleads_client, args.customer_ids, date_range, campaign_status, database)
\ No newline at end of file
+        max_pending = args.max_pending or (2 * MAX_THREADS if args.executor == 'thread' else MAX_PENDING)
+        main(googleads_client, args.customer_ids, date_range, campaign_status, database,
+             batch_size = args.batch_size, max_pending = max_pending, extraction = args.extraction,
+             engine = args.engine, concurrency = args.concurrency, executor = args.executor,
+             adaptive = args.adaptive, min_concurrency = args.min_concurrency, rps = args.rps, burst = args.burst,
+             customer_rps = args.customer_rps, customer_burst = args.customer_burst,
+             max_retries = args.max_retries, backoff_base = args.backoff_base, backoff_cap = args.backoff_cap,
+             retry_budget = args.retry_budget, timeout = args.timeout, stall_timeout = args.stall_timeout,
+             hedge = args.hedge, state_db = args.state_db, plan = args.plan, shard_days = args.shard_days,
+             split_rows = args.split_rows, incremental = args.incremental, restatement_days = args.restatement_days,
+             cache_dir = None if args.no_cache else args.cache_dir, cache_max_bytes = args.cache_max_mb * 1024 ** 2,
+             cache_final_days = args.cache_final_days, resume = args.resume, rerun_failures = args.rerun_failures,
+             spool = args.spool, n_loaders = args.loaders, load_in_workers = args.load_in_workers,
+             merge = args.merge, direct = args.direct, runs_keep_days = args.runs_keep_days)
\ No newline at end of file
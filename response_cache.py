@@ -0,0 +1,128 @@
+"""Response cache: results of past search requests, kept on disk so that they don't get fetched again.
+Only requests whose dates are all old enough to be final (i.e.: CACHE_FINAL_DAYS days ago or before, past
+which conversions aren't restated anymore) get cached, so whatever's cached is as good as a fresh request.
+Every request's batches (as extracted by get_reports.iter_search_batches()) get pickled, one after the other,
+into a gzip file of their own, named after the hash of what determines them: the customer_id, the GAQL query,
+the dbschema and the extraction mode (and CACHE_VERSION). Files only show up once every batch has been written, so a request
+either is cached as a whole or it isn't, and reading a file counts as using it: once the cache grows past
+its size limit, files least recently used get evicted first (see ResponseCache.evict()).
+"""
+import os, gzip, pickle, hashlib, json, tempfile
+from datetime import date, timedelta
+
+CACHE_DIR = 'get_reports_cache'
+# Max size of the cache, in bytes
+CACHE_MAX_BYTES = 1024 ** 3
+# Dates at least CACHE_FINAL_DAYS days ago are considered final
+CACHE_FINAL_DAYS = 30
+# Part of every key: bumped whenever what gets cached changes, so that stale files just stop being used
+CACHE_VERSION = 2
+# gzip compression level. Batches are cheap to compress, but should be cheaper to write than to fetch
+COMPRESSION_LEVEL = 6
+
+class ResponseCache:
+    """A directory of cached requests. All there is to it is on disk, so any worker can be handed a copy"""
+    def __init__(self, path = CACHE_DIR, max_bytes = CACHE_MAX_BYTES, final_days = CACHE_FINAL_DAYS):
+        """
+        Args: path: the cache directory. Created if it doesn't exist.
+              max_bytes: max size of the cache. See evict().
+              final_days: see CACHE_FINAL_DAYS.
+        """
+        self.path, self.max_bytes, self.final_days = path, max_bytes, final_days
+        os.makedirs(path, exist_ok = True)
+
+    def _file(self, customer_id, query, extraction):
+        """Returns: the file where a request is (or would be) cached, or None if it can't be cached"""
+        if date.fromisoformat(query["shard"][1]) > date.today() - timedelta(days = self.final_days):
+            return None
+        key = json.dumps([CACHE_VERSION, customer_id, query["query"], query["dbschema"], extraction])
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest() + '.pickle.gz')
+
+    def get(self, customer_id, query, extraction):
+        """Looks a request up in the cache.
+        Args: customer_id: a client customer ID str.
+              query: the query, as defined in get_reports.main().
+              extraction: one of get_reports.EXTRACTION_MODES.
+        Returns: an iterator of the request's batches, or None if it isn't cached.
+        """
+        file = self._file(customer_id, query, extraction)
+        if file is None or not os.path.exists(file):
+            return None
+        os.utime(file)      # Recently used
+        return self._read(file)
+
+    def _read(self, file):
+        with gzip.open(file, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def writer(self, customer_id, query, extraction):
+        """Starts caching a request. See get().
+        Returns: a CacheWriter, or None if the request can't be cached.
+        """
+        file = self._file(customer_id, query, extraction)
+        return CacheWriter(file) if file else None
+
+    def tee(self, batches, customer_id, query, extraction):
+        """Caches a request's batches as they're iterated through. The request only gets cached if every
+        one of them is. See get().
+        Args: batches: an iterator of the request's batches.
+        Returns: an iterator of the same batches.
+        """
+        writer = self.writer(customer_id, query, extraction)
+        if writer is None:
+            yield from batches
+            return
+        done = False
+        try:
+            for batch in batches:
+                writer.write(batch)
+                yield batch
+            writer.commit()
+            done = True
+        finally:
+            if not done:
+                writer.discard()
+
+    def evict(self):
+        """Deletes cached requests, least recently used first, until the cache is no bigger than max_bytes.
+        Returns: (n_files, n_bytes) tuple of what got deleted.
+        """
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pickle.gz'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(s for _, s, _ in files)
+        n_files, n_bytes = 0, 0
+        for _, file_size, file in sorted(files):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            size, n_files, n_bytes = size - file_size, n_files + 1, n_bytes + file_size
+        return n_files, n_bytes
+
+class CacheWriter:
+    """Writes a request's batches to a temporary file, that only becomes its cache file once commit()ed"""
+    def __init__(self, file):
+        self.file = file
+        fd, self.tmp_file = tempfile.mkstemp(dir = os.path.dirname(file), suffix = '.tmp')
+        os.close(fd)
+        self._f = gzip.open(self.tmp_file, 'wb', compresslevel = COMPRESSION_LEVEL)
+
+    def write(self, batch):
+        pickle.dump(batch, self._f, protocol = pickle.HIGHEST_PROTOCOL)
+
+    def commit(self):
+        self._f.close()
+        os.replace(self.tmp_file, self.file)
+
+    def discard(self):
+        self._f.close()
+        os.remove(self.tmp_file)
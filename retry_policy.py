@@ -0,0 +1,84 @@
+"""Retry policy: which failed requests are worth retrying, and how long to wait before doing so.
+Errors are classified (see classify()) by their gRPC status and by the type of every error in their
+GoogleAdsFailure, as described by get_reports.describe_exception(), into:
+ * PERMANENT: retrying is pointless (e.g.: authentication, invalid queries, daily quota exhausted...)
+ * TRANSIENT: the server had a hiccup (e.g.: INTERNAL, UNAVAILABLE, DEADLINE_EXCEEDED...)
+ * QUOTA: the request got throttled. Worth retrying, but only after a longer wait
+Retries wait an exponentially growing backoff, with full jitter so that jobs that failed together
+don't retry in lockstep, and every retry of the run draws from a single retry budget, shared by
+every worker, so that a bad day can't multiply the runtime.
+"""
+import multiprocessing, random
+
+from throttling import is_throttled
+
+PERMANENT, TRANSIENT, QUOTA = 'permanent', 'transient', 'quota'
+
+# Max n of retries per job / Backoff of the first retry, in secs / Max backoff, in secs
+MAX_RETRIES, BACKOFF_BASE, BACKOFF_CAP = 3, 1.0, 60.0
+# Throttled requests back off QUOTA_BACKOFF_FACTOR times longer
+QUOTA_BACKOFF_FACTOR = 8
+# Default retry budget of a run, as a ratio of its n of jobs
+RETRY_BUDGET_RATIO = 0.2
+
+# gRPC statuses worth retrying. Any other status is permanent, unless its errors say otherwise
+TRANSIENT_STATUSES = ('INTERNAL', 'UNAVAILABLE', 'DEADLINE_EXCEEDED', 'ABORTED', 'UNKNOWN')
+# GoogleAdsFailure error codes (as "<error_type>.<ENUM_NAME>", or just "<error_type>" for all of them)
+TRANSIENT_ERROR_CODES = ('internal_error', 'database_error.CONCURRENT_MODIFICATION')
+PERMANENT_ERROR_CODES = ('quota_error.RESOURCE_EXHAUSTED', )     # Daily quota: no use retrying until tomorrow
+
+def classify(error):
+    """Classifies a failed request's error as PERMANENT, TRANSIENT or QUOTA.
+    Args: error: an error as described by get_reports.describe_exception().
+    """
+    error_codes = [e["error_code"] for e in error["errors"] if e["error_code"]]
+    if any(_matches(error_code, PERMANENT_ERROR_CODES) for error_code in error_codes):
+        return PERMANENT
+    if is_throttled(error):
+        return QUOTA
+    if error["status"] in TRANSIENT_STATUSES:
+        return TRANSIENT
+    if error_codes and all(_matches(error_code, TRANSIENT_ERROR_CODES) for error_code in error_codes):
+        return TRANSIENT
+    return PERMANENT
+
+def _matches(error_code, error_codes):
+    return any(error_code == e or error_code.startswith(e + '.') for e in error_codes)
+
+class RetryPolicy:
+    """Decides whether (and when) failed requests get retried. Retries granted get counted in a
+    multiprocessing.Value, so the budget is one for the whole run, however many workers draw from it.
+    """
+    def __init__(self, max_retries = MAX_RETRIES, backoff_base = BACKOFF_BASE, backoff_cap = BACKOFF_CAP,
+                 budget = None):
+        """
+        Args: max_retries: max n of retries per job.
+              backoff_base: backoff of the first retry, in secs. Doubles on every retry...
+              backoff_cap: ... up to backoff_cap secs.
+              budget: max n of retries in total, for the whole run. None for no limit.
+        """
+        self.max_retries, self.backoff_base, self.backoff_cap = max_retries, backoff_base, backoff_cap
+        self.budget = budget
+        self._n_retries = multiprocessing.Value('i', 0)
+
+    @property
+    def n_retries(self):
+        """Retries granted so far, by every worker"""
+        return self._n_retries.value
+
+    def backoff(self, error, retry_count):
+        """Decides whether a failed request gets retried, drawing the retry from the budget if so.
+        Args: error: an error as described by get_reports.describe_exception().
+              retry_count: n of times the job has been retried already.
+        Returns: secs to wait before retrying, or None if it shouldn't be retried.
+        """
+        category = classify(error)
+        if category == PERMANENT or retry_count >= self.max_retries:
+            return None
+        with self._n_retries.get_lock():
+            if self.budget is not None and self._n_retries.value >= self.budget:
+                return None
+            self._n_retries.value += 1
+        # Full jitter: anywhere between 0 and the exponential backoff
+        backoff = self.backoff_base * 2 ** retry_count * (QUOTA_BACKOFF_FACTOR if category == QUOTA else 1)
+        return random.uniform(0, min(self.backoff_cap, backoff))
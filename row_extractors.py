@@ -0,0 +1,165 @@
+"""Row extractors: turn Google Ads API results into rows of bind values, according to a dbschema.
+A dbschema is a tuple of (gaql_field, sql_column) pairs (see get_reports.py). Walking the dotted
+GAQL path of every field of every row (see get_field()) is pure overhead repeated millions of times,
+so instead each dbschema gets compiled once into an extractor function that builds a whole row in
+a single pass. There are two kinds of extractors:
+ * compile_extractor(): for GoogleAdsRow dicts, as returned by json_format.MessageToDict()
+ * compile_proto_extractor(): straight from GoogleAdsRow protobuf messages, skipping MessageToDict()
+Both produce exactly the same rows.
+"""
+import sys, math
+
+def compile_extractor(dbschema):
+    """
+    Compiles dbschema into an extractor: a function that turns a GoogleAdsRow dict (as returned
+    by json_format.MessageToDict()) into a tuple of bind values, in dbschema order. Equivalent to
+    calling get_field() on each field, and stringifying its value with stringify().
+    The extractor is generated source code with every key path already camelCased and unrolled
+    into chained dict lookups, e.g.: stringify(row.get('adGroupCriterion', {}).get('status'))
+    Args: dbschema: a tuple of (gaql_field, sql_column) pairs. gaql_field may be None.
+    Returns: a function of a GoogleAdsRow dict, returning a tuple of str.
+    """
+    exprs = []
+    for field, _ in dbschema:
+        if not field:   # FIXME: Exists to deal with None's in the schema (see get_field())
+            exprs.append(repr(str(None)))
+            continue
+        keys = [as_camelcase(attr) for attr in field.split('.')]
+        expr = "row"
+        for key in keys[:-1]:
+            expr += f".get({key!r}, _EMPTY)"
+        exprs.append(f"stringify({expr}.get({keys[-1]!r}))")
+    
+    source = ( "def extract(row):\n"
+               "    return (" + ",\n            ".join(exprs) + ",)\n" )
+    namespace = {"_EMPTY": {}, "stringify": stringify}   # NOTE: _EMPTY is only ever read, never written
+    exec(source, namespace)
+    return namespace["extract"]
+
+def compile_proto_extractor(dbschema, descriptor):
+    """
+    Compiles dbschema into an extractor of GoogleAdsRow protobuf messages: a function that reads
+    each field straight from the message and returns a tuple of bind values, in dbschema order.
+    The resulting rows are the same compile_extractor() would produce from MessageToDict(row):
+     * fields MessageToDict() would leave out (unset, or proto3 default values for fields without
+       presence, or empty repeated fields) become 'None'
+     * enums become their names, through a precomputed number -> name lookup
+     * repeated fields become their first element
+    Accepts both raw protobuf and proto-plus wrapped messages (i.e.: whatever use_proto_plus is).
+    Args: dbschema: a tuple of (gaql_field, sql_column) pairs. gaql_field may be None.
+          descriptor: the GoogleAdsRow protobuf message Descriptor.
+    Returns: a function of a GoogleAdsRow message, returning a tuple of str.
+    """
+    namespace = {"_float": _stringify_float}
+    lines = []
+    for i, (field, _) in enumerate(dbschema):
+        if not field:   # FIXME: Exists to deal with None's in the schema (see get_field())
+            lines.append(f"v{i} = {str(None)!r}")
+            continue
+        
+        # Resolve the path to the field's parent message, and the field's own FieldDescriptor
+        attrs = []
+        desc = descriptor
+        for attr in field.split('.'):
+            if attr not in desc.fields_by_name:     # Google Ads protos rename fields clashing with
+                attr += '_'                         # Python builtins, e.g.: ad.type -> ad.type_
+            fd = desc.fields_by_name[attr]
+            attrs.append(attr)
+            desc = fd.message_type
+        if fd.type == fd.TYPE_MESSAGE:
+            raise ValueError(f"{field} is a message, only scalar fields can be extracted")
+        
+        # Build an expression that converts the field's value `v` into a str
+        if fd.type == fd.TYPE_ENUM:
+            namespace[f"_names{i}"] = {v.number: v.name for v in fd.enum_type.values}
+            conv = f"_names{i}.get(v, str(v))"
+        elif fd.type in (fd.TYPE_DOUBLE, fd.TYPE_FLOAT):
+            conv = "_float(v)"
+        else:
+            conv = "str(v)"
+        
+        parent = '.'.join(("row", *attrs[:-1]))
+        lines.append(f"v = {parent}.{attrs[-1]}")
+        if fd.label == fd.LABEL_REPEATED:
+            lines.append("v = v[0] if len(v) else None")
+            lines.append(f"v{i} = {conv} if v is not None else 'None'")
+        elif fd.has_presence:
+            lines.append(f"v{i} = {conv} if {parent}.HasField({attrs[-1]!r}) else 'None'")
+        else:           # proto3 field without presence: its default value means it's unset
+            lines.append(f"v{i} = {conv} if v else 'None'")
+    
+    source = ( "def extract(row):\n"
+               "    row = getattr(row, '_pb', row)  # unwrap proto-plus messages\n"
+               "    " + "\n    ".join(lines) + "\n"
+               "    return (" + ", ".join(f"v{i}" for i in range(len(dbschema))) + ",)\n" )
+    exec(source, namespace)
+    return namespace["extract"]
+
+def _stringify_float(f):
+    """Stringifies a float the way MessageToDict() + str() would"""
+    if math.isnan(f):
+        return 'NaN'
+    if math.isinf(f):
+        return 'Infinity' if f > 0 else '-Infinity'
+    return str(f)
+
+def stringify(f):
+    """
+    Stringifies a field's value as a bind value for the database.
+    NOTE: for 'plurals', GoogleAds return a list. If it's not a list, stringify. If it is a list AND
+       it ain't empty, stringify it's first element. If it is empty, settle for a stringified 'None'
+    Args: f: a field's value, as returned by get_field()
+    """
+    return (str(f[0]) if len(f) > 0 else str(None)) if isinstance(f, list) else str(f)
+
+def as_camelcase(string):
+    """
+    Convert a string from snake_case to camelCase
+    Args: string: A string to be converted from snake_case to camelCase
+                                                              by Ленина
+    """
+    substrings = string.split('_')
+    if substrings[1:]:
+        substrings[1:] = [s.capitalize() for s in substrings[1:]]
+    
+    return ''.join(substrings)
+
+def get_field(mapping, field):
+    """
+    Treewalks a given dictionary's keys in order to access a nested
+    field. If such field does not exist, it returns 'None'.
+    NOTE: if field == None, then it defaults to returning None. While
+          this is a kruft added to deal with an outdated database, on
+          the other hand it seems like a 'sane' behaviour all by itself
+    Args: mapping: A dictionary, maybe having dictionaries for values
+          field: A point-separated ('.') separated string that
+              specifies a key potentially buried within nested dicts
+              It expects each point-delimited substring as snake-case,
+              and converts them into camelCase prior to using them to
+              treewalk mapping.
+                                                              by Ленина
+    """
+    if not field:   # FIXME: Exists to deal with None's in the schema, that themselves exist
+        return None # in order to deal with an outdated (and to be fixed), database schema
+
+    attrs = field.split('.')
+    attrs = [as_camelcase(attr) for attr in attrs]
+    attrs.reverse() # reverse in place so as to be treated as a stack
+
+    if attrs:                           # XXX: is this redundant? ... i think it is...
+        pivot = mapping[attrs.pop()]
+    else:
+        return None
+  
+    while attrs:
+        try:
+            pivot = pivot[attrs.pop()]
+        except KeyError:    # the Google Ads API returned a non-existent field ... assume that field is empty
+            return None     # it signals an empty field
+        except Exception as ex:
+            print("stderr:", "SOMETHING WENT AWFULY WRONG!!!", file = sys.stderr)
+            print("stderr:", "+++ DEBUG INFO: ", file = sys.stderr)
+            print("stderr:", '\t', ex, file = sys.stderr)
+            raise     
+    
+    return pivot
@@ -0,0 +1,133 @@
+"""Run manifest: what every run of get_reports.py set out to do, and how far it got, so that an interrupted
+run (e.g.: by a database disconnect, or a killed cron job) can be resumed without redoing what's done.
+Every run gets a RUN_ID and a directory of its own, RUNS_DIR/<RUN_ID>/, where its manifest is a JSON lines
+file, appended to (and flushed) as the run goes:
+ * the run itself: which database it loads into, and how.
+ * PLANNED: every task (i.e.: every (customer_id, query name, date shard, campaign part) job), GAQL included.
+ * LOADED: every row of the task has been fetched and INSERTed (batches get loaded as they're fetched), but
+     not committed yet. NOTE: if the run dies right then, the task may or may not have been committed.
+ * COMMITTED: the task is done.
+ * FAILED: the task failed, and got rolled back.
+Resuming a run replays its unfinished tasks (i.e.: not COMMITTED), appending to the very same manifest.
+Once the run is over, its failed tasks (if any) also get written to a JSON file of their own, FAILURES_FILE,
+along with their errors, so that they can be looked into, or re-run on their own (see read_failures()).
+Runs done, every task COMMITTED, get their directories removed after a while (see prune_runs()). Runs with
+tasks left unfinished are kept, however old, to be resumed or looked into: it's up to whoever runs them to
+remove those from RUNS_DIR once dealt with.
+"""
+import os, json, threading, shutil, time
+from datetime import datetime
+
+RUNS_DIR = 'runs'
+MANIFEST_FILE = 'manifest.jsonl'
+FAILURES_FILE = 'failures.json'
+RUNS_KEEP_DAYS = 30     # Days runs done are kept for after they were last written to. See prune_runs()
+RUN, PLANNED, LOADED, COMMITTED, FAILED = 'run', 'planned', 'loaded', 'committed', 'failed'
+
+class RunManifest:
+    """The manifest of a run, new or to be resumed. Meant to be written by the parent process only, by any
+    of its threads.
+    """
+    def __init__(self, run_id = None, path = RUNS_DIR):
+        """
+        Args: run_id: the RUN_ID of the run to resume. None for a new run, with a new RUN_ID.
+              path: the directory of every run's directory.
+        """
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]   # Down to the millisecond
+        self.dir = os.path.join(path, self.run_id)
+        self.file = os.path.join(self.dir, MANIFEST_FILE)
+        self.run = None     # The run's RUN record
+        self.tasks = {}     # The PLANNED record and last status of every task, by task_key
+        if run_id is None:
+            os.makedirs(self.dir)
+        else:
+            with open(self.file) as f:
+                for line in f:
+                    self._apply(json.loads(line))
+        self._f = open(self.file, 'a')
+        self._lock = threading.Lock()
+
+    def _apply(self, record):
+        if record["status"] == RUN:
+            self.run = record
+            return
+        task_key = (record["customer_id"], record["query_name"], tuple(record["shard"]), tuple(record["part"]))
+        if record["status"] == PLANNED:
+            self.tasks[task_key] = {"planned": record, "status": PLANNED}
+        else:
+            self.tasks[task_key]["status"] = record["status"]
+
+    def _write(self, record):
+        with self._lock:
+            self._apply(record)
+            self._f.write(json.dumps(record) + '\n')
+            self._f.flush()
+
+    def start(self, **run):
+        """Records the run itself: whatever's needed to resume it as it was (e.g.: the database)"""
+        self._write(dict(run, status = RUN, run_id = self.run_id, started_at = datetime.now().isoformat(timespec = 'seconds')))
+
+    def record(self, status, customer_id, query, **info):
+        """Records a task's new status.
+        Args: status: one of PLANNED, LOADED, COMMITTED or FAILED.
+              customer_id: the task's client customer ID str.
+              query: the task's query, as defined in get_reports.main().
+              info: anything else worth recording, e.g.: n of rows.
+        """
+        record = _task(customer_id, query, status = status)
+        if status == PLANNED:
+            record["query"] = query["query"]
+        self._write(dict(record, **info, at = datetime.now().isoformat(timespec = 'seconds')))
+
+    def write_failures(self, failures):
+        """Writes the failed tasks of the run to its FAILURES_FILE, as PLANNED (so that they can be re-run
+        just like that), along with their errors.
+        Args: failures: a list of failed jobs, as labelled by get_reports.job_result().
+        Returns: the path of the file.
+        """
+        file = os.path.join(self.dir, FAILURES_FILE)
+        tasks = [dict(_task(job["customer_id"], job["query"]), query = job["query"]["query"], error = job["error"])
+                 for job in failures]
+        with open(file, 'w') as f:
+            json.dump(dict(self.run, failures = tasks), f, indent = 1)
+        return file
+
+    def unfinished(self):
+        """Returns: the PLANNED records of every task not COMMITTED yet, in the order they were planned"""
+        return [task["planned"] for task in self.tasks.values() if task["status"] != COMMITTED]
+
+    def close(self):
+        self._f.close()
+
+def _task(customer_id, query, **record):
+    """Returns: a task's record, identifying it by its task_key"""
+    return dict(record, customer_id = customer_id, query_name = query["name"], shard = query["shard"], part = query["part"])
+
+def prune_runs(keep_days = RUNS_KEEP_DAYS, path = RUNS_DIR):
+    """Removes the directories of every run done (i.e.: every task COMMITTED) whose manifest hasn't been
+    written to for keep_days days. Runs with tasks left unfinished are left as they are.
+    Args: keep_days: days runs done are kept for.
+          path: the directory of every run's directory.
+    Returns: the RUN_IDs of the runs removed.
+    """
+    cutoff = time.time() - keep_days * 24 * 3600
+    removed = []
+    for run_id in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+        file = os.path.join(path, run_id, MANIFEST_FILE)
+        if not os.path.isfile(file) or os.path.getmtime(file) > cutoff:
+            continue
+        manifest = RunManifest(run_id, path)
+        manifest.close()
+        if not manifest.unfinished():
+            shutil.rmtree(manifest.dir)
+            removed.append(run_id)
+    return removed
+
+def read_failures(file):
+    """Reads the failed tasks of a run, as written by RunManifest.write_failures(). Tasks can be left out
+    of the file, as long as the rest of them are left as they were.
+    Returns: a (run, tasks) tuple: the run's RUN record, and the PLANNED records of its failed tasks.
+    """
+    with open(file) as f:
+        run = json.load(f)
+    return run, run.pop("failures")
@@ -0,0 +1,76 @@
+"""Spool: results of jobs in flight, written to disk by the workers, so that only where to read them from has
+to be passed along to the loader (see get_reports.issue_search_request()).
+Every job gets a spool file of its own in the run's directory, a sequence of records: every batch of results,
+pickled and zlib compressed, prefixed by its length and its n of results (a HEADER). A (0, 0) header closes
+a complete spool file. Records are read back (see read_batch()) by their descriptor: a (file, offset, length,
+n_results) tuple. Spool files get deleted once their job is committed (or rolled back), so the ones left behind
+belong to jobs of an interrupted run: those that are complete can be loaded again without being fetched again
+(see replay()).
+"""
+import os, struct, zlib, pickle
+
+HEADER = struct.Struct('>II')
+# zlib compression level. Spool files are short lived: compressing them should cost next to nothing
+SPOOL_COMPRESSION_LEVEL = 1
+
+def spool_file(spool_dir, task_key):
+    """Returns: the spool file of a job"""
+    customer_id, query_name, (start, end), (i, n) = task_key
+    return os.path.join(spool_dir, f"{customer_id}_{query_name}_{start}_{end}_{i}of{n}.spool")
+
+class SpoolWriter:
+    """Writes a job's batches to its spool file, created (or truncated) on the first one"""
+    def __init__(self, file):
+        self.file = file
+        self._f = None
+        self._offset = 0
+
+    def write(self, batch):
+        """Returns: the descriptor of the batch's record"""
+        if self._f is None:
+            self._f = open(self.file, 'wb')
+        data = zlib.compress(pickle.dumps(batch, protocol = pickle.HIGHEST_PROTOCOL), SPOOL_COMPRESSION_LEVEL)
+        self._f.write(HEADER.pack(len(data), len(batch)))
+        self._f.write(data)
+        self._f.flush()     # Before its descriptor gets to the loader
+        descriptor = (self.file, self._offset + HEADER.size, len(data), len(batch))
+        self._offset += HEADER.size + len(data)
+        return descriptor
+
+    def close(self):
+        """Closes the spool file as complete"""
+        if self._f is None:
+            self._f = open(self.file, 'wb')
+        self._f.write(HEADER.pack(0, 0))
+        self._f.close()
+
+    def abort(self):
+        """Closes the spool file as it is: incomplete"""
+        if self._f is not None:
+            self._f.close()
+
+def read_batch(descriptor):
+    """Returns: the batch of a record, by its descriptor"""
+    file, offset, length, _ = descriptor
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        return pickle.loads(zlib.decompress(f.read(length)))
+
+def replay(file):
+    """Returns: the descriptors of every record of a complete spool file, or None if it's not complete (or
+    there's no such file)
+    """
+    descriptors = []
+    try:
+        with open(file, 'rb') as f:
+            while header := f.read(HEADER.size):
+                if len(header) < HEADER.size:
+                    return None
+                length, n_results = HEADER.unpack(header)
+                if not length:
+                    return descriptors
+                descriptors.append((file, f.tell(), length, n_results))
+                f.seek(length, os.SEEK_CUR)
+    except FileNotFoundError:
+        pass
+    return None
@@ -0,0 +1,88 @@
+"""State store: what get_reports.py remembers from one run to the next, in a local SQLite database.
+ * job_stats: rows and duration per day queried of every (customer_id, query name) job, smoothed over
+     runs. Used to schedule jobs biggest first (see get_reports.generate_inputs()), and to predict the
+     schedule (--plan), for any date range.
+ * watermarks: the last date fully loaded of every (database, customer_id, query name, campaign status). Used
+     by --incremental runs to fetch only what's missing since (see get_reports.incremental_date_range()).
+"""
+import sqlite3
+from datetime import datetime, date
+
+STATE_DB_FILE = 'get_reports_state.sqlite3'
+# Weight of the latest run in the smoothed stats
+SMOOTHING = 0.5
+
+class StateStore:
+    """A connection to the state store. Not meant to be shared across processes: the parent process records
+    what the workers report.
+    """
+    def __init__(self, path = STATE_DB_FILE):
+        """
+        Args: path: the SQLite database file. Created if it doesn't exist.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS job_stats ("
+                              "  customer_id TEXT NOT NULL,"
+                              "  query_name  TEXT NOT NULL,"
+                              "  n_rows      REAL NOT NULL,"
+                              "  duration    REAL NOT NULL,"
+                              "  n_runs      INTEGER NOT NULL,"
+                              "  updated_at  TEXT NOT NULL,"
+                              "  PRIMARY KEY (customer_id, query_name))")
+            # Watermarks of old, not keyed by campaign status, can't tell what they were loaded of: they go
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(watermarks)")]
+            if columns and "campaign_status" not in columns:
+                self.conn.execute("DROP TABLE watermarks")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS watermarks ("
+                              "  database        TEXT NOT NULL,"
+                              "  customer_id     TEXT NOT NULL,"
+                              "  query_name      TEXT NOT NULL,"
+                              "  campaign_status TEXT NOT NULL,"
+                              "  loaded_through  TEXT NOT NULL,"
+                              "  updated_at      TEXT NOT NULL,"
+                              "  PRIMARY KEY (database, customer_id, query_name, campaign_status))")
+
+    def record(self, customer_id, query_name, n_rows, duration, n_days = 1):
+        """Records a successful job's rows and duration (in secs) per day, smoothing them with those of previous
+        runs. NOTE: jobs spanning n_days days are assumed to be n_days times as big as jobs spanning a single one.
+        """
+        with self.conn:
+            self.conn.execute("INSERT INTO job_stats VALUES (?, ?, ?, ?, 1, ?) "
+                              "ON CONFLICT (customer_id, query_name) DO UPDATE SET "
+                              f"  n_rows     = {1 - SMOOTHING} * n_rows   + {SMOOTHING} * excluded.n_rows,"
+                              f"  duration   = {1 - SMOOTHING} * duration + {SMOOTHING} * excluded.duration,"
+                              "  n_runs     = n_runs + 1,"
+                              "  updated_at = excluded.updated_at",
+                              (customer_id, query_name, n_rows / n_days, duration / n_days,
+                               datetime.now().isoformat(timespec = 'seconds')))
+
+    def predict(self, customer_id, query_name, n_days = 1):
+        """Returns: a job's predicted (n_rows, duration) tuple for n_days days, or None if it's never been recorded"""
+        return self.conn.execute("SELECT n_rows * ?, duration * ? FROM job_stats WHERE customer_id = ? AND query_name = ?",
+                                 (n_days, n_days, customer_id, query_name)).fetchone()
+
+    def watermark(self, database, customer_id, query_name, campaign_status):
+        """Returns: the last date fully loaded of a (customer_id, query name) into database, of the campaigns with
+        campaign_status, or None if it's never been
+        """
+        row = self.conn.execute("SELECT loaded_through FROM watermarks "
+                                "WHERE database = ? AND customer_id = ? AND query_name = ? AND campaign_status = ?",
+                                (database, customer_id, query_name, campaign_status)).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def set_watermark(self, database, customer_id, query_name, campaign_status, loaded_through):
+        """Records the last date fully loaded of a (customer_id, query name) into database, of the campaigns with
+        campaign_status. It can go back, too.
+        """
+        with self.conn:
+            self.conn.execute("INSERT INTO watermarks VALUES (?, ?, ?, ?, ?, ?) "
+                              "ON CONFLICT (database, customer_id, query_name, campaign_status) DO UPDATE SET "
+                              "  loaded_through = excluded.loaded_through,"
+                              "  updated_at     = excluded.updated_at",
+                              (database, customer_id, query_name, campaign_status, loaded_through.isoformat(),
+                               datetime.now().isoformat(timespec = 'seconds')))
+
+    def close(self):
+        self.conn.close()
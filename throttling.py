@@ -0,0 +1,141 @@
+"""Throttling: keeps the number of requests in flight in line with what the Google Ads API can take.
+Quota is enforced per developer token (and per customer), so a fixed number of requests in flight is
+either too timid or too greedy depending on the accounts, the time of day, and whoever else is
+using the same token. AdaptiveConcurrency instead finds the limit at runtime, AIMD style:
+ * additive increase: one more request in flight after every limit healthy jobs in a row.
+ * multiplicative decrease: halves the limit as soon as a job gets throttled (RESOURCE_EXHAUSTED, or
+     a quota_error), and takes one off when latency degrades (i.e.: the server is queueing them).
+Every change of the limit gets logged, along with its reason.
+RateLimiter, on the other hand, keeps requests per second under a fixed rate (a token bucket, globally
+and, optionally, per customer) shared by every worker, so that quota isn't exceeded to begin with.
+"""
+import threading, multiprocessing, asyncio, time
+
+# A job's latency is considered degraded when it's LATENCY_TOLERANCE times worse than the best seen
+LATENCY_TOLERANCE = 2.0
+# Weight of each new latency in the moving average
+LATENCY_SMOOTHING = 0.2
+
+def is_throttled(error):
+    """Tells whether a failed request was rejected for exceeding some quota or rate limit.
+    Args: error: an error as described by get_reports.describe_exception().
+    """
+    if error["status"] == "RESOURCE_EXHAUSTED":     # Comes as a plain gRPC error
+        return True
+    return any((e["error_code"] or '').startswith("quota_error.") for e in error["errors"])
+
+class AdaptiveConcurrency:
+    """AIMD controller of the number of requests in flight. Whoever runs the jobs should never have
+    more than .limit of them in flight, and must report every finished job to .on_done().
+    Thread safe.
+    """
+    def __init__(self, initial, maximum, minimum = 1, decrease_factor = 0.5,
+                 latency_tolerance = LATENCY_TOLERANCE, log = print):
+        """
+        Args: initial: the initial limit.
+              maximum, minimum: bounds of the limit.
+              decrease_factor: what the limit gets multiplied by when a job gets throttled.
+              latency_tolerance: see LATENCY_TOLERANCE.
+              log: a print-like function where every change of the limit gets logged.
+        """
+        self.minimum, self.maximum = max(1, minimum), max(1, minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.decrease_factor, self.latency_tolerance = decrease_factor, latency_tolerance
+        self.log = log
+        self.n_throttled = 0
+        self._n_healthy = 0         # Healthy jobs in a row, since the last change of the limit
+        self._n_ignored = 0         # Jobs still to finish that were in flight before the last decrease
+        self._latency = None        # Moving average of the latency to the first batch
+        self._best_latency = None
+        self._lock = threading.Lock()
+        self.log(f"CONCURRENCY LIMIT: {self.limit} (min {self.minimum}, max {self.maximum})")
+
+    def on_done(self, job):
+        """Updates the limit according to how a finished job went.
+        Args: job: a job as labelled by get_reports.job_result().
+        """
+        with self._lock:
+            latency = job.get("latency")
+            if latency is not None:
+                self._latency = latency if self._latency is None else \
+                    (1 - LATENCY_SMOOTHING) * self._latency + LATENCY_SMOOTHING * latency
+                self._best_latency = min(self._best_latency or self._latency, self._latency)
+
+            # Jobs already in flight when the limit was last decreased were issued under the old limit:
+            # they say nothing about the new one, so they can't decrease it any further
+            ignored = self._n_ignored > 0
+            self._n_ignored -= ignored
+
+            if job.get("n_throttled"):
+                self.n_throttled += 1
+                if not ignored:
+                    self._set_limit(int(self.limit * self.decrease_factor),
+                                    f"throttled: {job['customer_id']} / {job['query']['name']}")
+            elif self._latency is not None and self._latency > self.latency_tolerance * self._best_latency:
+                if not ignored:
+                    self._set_limit(self.limit - 1, f"latency {self._latency:.2f}s, "
+                                                    f"best {self._best_latency:.2f}s")
+            else:
+                self._n_healthy += 1
+                if self._n_healthy >= self.limit:
+                    self._set_limit(self.limit + 1, f"{self._n_healthy} healthy jobs in a row")
+
+    def _set_limit(self, limit, reason):
+        limit = min(max(limit, self.minimum), self.maximum)
+        self._n_healthy = 0
+        if limit < self.limit:
+            self._n_ignored = self.limit
+        if limit != self.limit:
+            self.log(f"CONCURRENCY LIMIT: {self.limit} -> {limit} // {reason}")
+            self.limit = limit
+
+class RateLimiter:
+    """Token buckets limiting the rate at which requests get issued: one for every request, and optionally
+    one per customer. Buckets refill at rate tokens per sec, up to burst tokens, and every request takes one
+    token from each of its buckets. Buckets live in a multiprocessing.Array, under its lock, so worker
+    processes given the limiter by their pool initializer draw from the same buckets as the parent's threads.
+    """
+    def __init__(self, rate = None, burst = None, customer_ids = (), customer_rate = None, customer_burst = None):
+        """
+        Args: rate: max requests per sec, in total. None for no limit.
+              burst: max requests issued at once, after some idle time. Defaults to rate (at least 1).
+              customer_ids: the customers to be sub-limited. Buckets can't be added once shared.
+              customer_rate, customer_burst: same as rate and burst, for each customer on its own.
+        """
+        self.rate, self.burst = rate, burst or max(1, rate or 0)
+        self.customer_rate, self.customer_burst = customer_rate, customer_burst or max(1, customer_rate or 0)
+        self._buckets = {}  # Bucket index in _state, by customer_id (None for the global one)
+        if rate:
+            self._buckets[None] = 0
+        if customer_rate:
+            for customer_id in customer_ids:
+                self._buckets.setdefault(customer_id, len(self._buckets))
+        # Every bucket is a (tokens, time of last refill) pair. Buckets start full
+        now = time.monotonic()
+        self._state = multiprocessing.Array('d', 2 * len(self._buckets))
+        for key, i in self._buckets.items():
+            self._state[2 * i], self._state[2 * i + 1] = (self.burst if key is None else self.customer_burst), now
+
+    def reserve(self, customer_id = None):
+        """Takes a token from every bucket of customer_id, borrowing from the future if some bucket falls short.
+        Returns: secs to wait before issuing the request.
+        """
+        wait = 0.0
+        with self._state.get_lock():
+            now = time.monotonic()
+            for key in {None, customer_id} & self._buckets.keys():
+                i = self._buckets[key]
+                rate, burst = (self.rate, self.burst) if key is None else (self.customer_rate, self.customer_burst)
+                tokens, last = self._state[2 * i], self._state[2 * i + 1]
+                tokens = min(burst, tokens + (now - last) * rate) - 1
+                self._state[2 * i], self._state[2 * i + 1] = tokens, now
+                wait = max(wait, -tokens / rate)
+        return wait
+
+    def acquire(self, customer_id = None):
+        """Blocks until a request for customer_id can be issued"""
+        time.sleep(self.reserve(customer_id))
+
+    async def acquire_async(self, customer_id = None):
+        """Coroutine version of acquire()"""
+        await asyncio.sleep(self.reserve(customer_id))